@@ -1,5 +1,34 @@
 from django.contrib import admin
-from .models import Category, Quiz, Question, Choice, QuizAttempt, UserAnswer
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.html import format_html_join
+from django.utils import timezone
+
+from .models import (
+    Category, Quiz, Question, Choice, QuestionStats, QuizAttempt, UserAnswer, UserCategorySummary,
+    UserScoreSummary,
+)
+from .packed_answers import attempt_user_answers
+from .question_bank import export_lines
+from .results_export import export_lines as export_result_lines
+from .signals import content_changes
+from .streaming import gzip_chunks
+
+
+class ContentChangesMixin:
+    """Bump each edited quiz's versions once per form, action or delete (see content_changes)."""
+
+    def changeform_view(self, *args, **kwargs):
+        with transaction.atomic(), content_changes():
+            return super().changeform_view(*args, **kwargs)
+
+    def changelist_view(self, *args, **kwargs):
+        with transaction.atomic(), content_changes():
+            return super().changelist_view(*args, **kwargs)
+
+    def delete_view(self, *args, **kwargs):
+        with transaction.atomic(), content_changes():
+            return super().delete_view(*args, **kwargs)
 
 
 class ChoiceInline(admin.TabularInline):
@@ -19,24 +48,112 @@ class CategoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(Quiz)
-class QuizAdmin(admin.ModelAdmin):
-    list_display = ['title', 'category', 'difficulty', 'questions_count', 'time_limit', 'is_active', 'created_at']
+class QuizAdmin(ContentChangesMixin, admin.ModelAdmin):
+    list_display = ['title', 'category', 'difficulty', 'questions_count', 'active_question_count', 'time_limit', 'is_active', 'created_at']
     list_filter = ['category', 'difficulty', 'is_active', 'created_at']
     search_fields = ['title', 'description']
+    readonly_fields = ['active_question_count', 'total_points']
     inlines = [QuestionInline]
+    actions = ['export_questions_jsonl', 'export_questions_csv']
 
     def save_model(self, request, obj, form, change):
         if not change:  # If creating new quiz
             obj.created_by = request.user
         super().save_model(request, obj, form, change)
 
+    def _export_questions(self, queryset, fmt, content_type):
+        # Streamed line by line, the file is never built in memory
+        questions = Question.objects.filter(quiz__in=queryset)
+        response = StreamingHttpResponse(export_lines(questions, fmt), content_type=content_type)
+        filename = f'questions-{timezone.localdate():%Y%m%d}.{fmt}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.action(description='Export questions of selected quizzes (JSON Lines)')
+    def export_questions_jsonl(self, request, queryset):
+        return self._export_questions(queryset, 'jsonl', 'application/x-ndjson; charset=utf-8')
+
+    @admin.action(description='Export questions of selected quizzes (CSV)')
+    def export_questions_csv(self, request, queryset):
+        return self._export_questions(queryset, 'csv', 'text/csv; charset=utf-8')
+
+
+class QuestionStatsInline(admin.StackedInline):
+    model = QuestionStats
+    can_delete = False
+    fields = readonly_fields = [
+        'answer_count', 'p_value', 'discrimination', 'time_mean', 'time_median', 'time_p90',
+        'choice_selection', 'updated_at',
+    ]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Choice selection')
+    def choice_selection(self, obj):
+        rows = [
+            (choice.choice_text, ' (correct)' if choice.is_correct else '',
+             f"{obj.choice_counts.get(str(choice.id), 0) / obj.answer_count:.0%}" if obj.answer_count else '-')
+            for choice in obj.question.choices.all()
+        ]
+        return format_html_join('', '<div>{}{}: {}</div>', rows)
+
+
+class ItemQualityFilter(admin.SimpleListFilter):
+    """Questions worth a look, from the stats of update_question_stats."""
+    title = 'item analysis'
+    parameter_name = 'item_quality'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('easy', 'Too easy (over 90% right)'),
+            ('hard', 'Too hard (under 20% right)'),
+            ('misleading', 'Misleading (negative discrimination)'),
+            ('unmeasured', 'No stats yet'),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'easy':
+            return queryset.filter(stats__p_value__gt=0.9)
+        if self.value() == 'hard':
+            return queryset.filter(stats__p_value__lt=0.2)
+        if self.value() == 'misleading':
+            return queryset.filter(stats__discrimination__lt=0)
+        if self.value() == 'unmeasured':
+            return queryset.filter(stats__isnull=True)
+        return queryset
+
 
 @admin.register(Question)
-class QuestionAdmin(admin.ModelAdmin):
-    list_display = ['question_text', 'quiz', 'question_type', 'points', 'time_limit', 'is_active']
-    list_filter = ['quiz', 'question_type', 'is_active']
-    search_fields = ['question_text']
-    inlines = [ChoiceInline]
+class QuestionAdmin(ContentChangesMixin, admin.ModelAdmin):
+    list_display = [
+        'question_text', 'quiz', 'question_type', 'points', 'time_limit', 'is_active',
+        'answer_count', 'p_value', 'discrimination', 'median_time',
+    ]
+    list_filter = ['quiz', 'question_type', 'is_active', ItemQualityFilter]
+    list_select_related = ['quiz', 'stats']
+    search_fields = ['question_text', 'external_key']
+    inlines = [ChoiceInline, QuestionStatsInline]
+
+    @admin.display(description='Answers', ordering='stats__answer_count')
+    def answer_count(self, obj):
+        stats = getattr(obj, 'stats', None)
+        return stats.answer_count if stats else None
+
+    @admin.display(description='P-value', ordering='stats__p_value')
+    def p_value(self, obj):
+        stats = getattr(obj, 'stats', None)
+        return f"{stats.p_value:.2f}" if stats and stats.p_value is not None else None
+
+    @admin.display(description='Discrimination', ordering='stats__discrimination')
+    def discrimination(self, obj):
+        stats = getattr(obj, 'stats', None)
+        return f"{stats.discrimination:.2f}" if stats and stats.discrimination is not None else None
+
+    @admin.display(description='Median time (s)', ordering='stats__time_median')
+    def median_time(self, obj):
+        stats = getattr(obj, 'stats', None)
+        return stats.time_median if stats else None
 
 
 @admin.register(QuizAttempt)
@@ -44,15 +161,61 @@ class QuizAttemptAdmin(admin.ModelAdmin):
     list_display = ['user', 'quiz', 'score', 'total_questions', 'get_percentage', 'completed_at']
     list_filter = ['quiz', 'completed_at', 'is_completed']
     search_fields = ['user__username', 'quiz__title']
-    readonly_fields = ['score', 'total_questions', 'time_taken', 'started_at', 'completed_at']
+    readonly_fields = ['score', 'total_questions', 'time_taken', 'started_at', 'completed_at', 'packed_answer_list']
+    actions = ['export_answers_csv', 'export_answers_jsonl']
 
     def get_percentage(self, obj):
         return f"{obj.get_percentage()}%"
     get_percentage.short_description = 'Percentage'
 
+    @admin.display(description='Packed answers')
+    def packed_answer_list(self, obj):
+        # Packed attempts have no UserAnswer rows to look at
+        if obj.packed_answers is None:
+            return '-'
+        rows = [
+            (answer.question.question_text[:80], answer.selected_choice or '-',
+             'right' if answer.is_correct else 'wrong', answer.time_taken)
+            for answer in attempt_user_answers(obj)
+        ]
+        return format_html_join('', '<div>{}: {} ({}, {}s)</div>', rows)
+
+    def _export_answers(self, queryset, fmt):
+        # Filter the list (quiz, date, completion) and select all to export
+        # everything that matches; the file is gzipped as it streams
+        response = StreamingHttpResponse(gzip_chunks(export_result_lines(queryset, fmt)), content_type='application/gzip')
+        filename = f'attempts-{timezone.localdate():%Y%m%d}.{fmt}.gz'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.action(description='Export selected attempts with their answers (CSV, gzipped)')
+    def export_answers_csv(self, request, queryset):
+        return self._export_answers(queryset, 'csv')
+
+    @admin.action(description='Export selected attempts with their answers (JSON Lines, gzipped)')
+    def export_answers_jsonl(self, request, queryset):
+        return self._export_answers(queryset, 'jsonl')
+
 
 @admin.register(UserAnswer)
 class UserAnswerAdmin(admin.ModelAdmin):
     list_display = ['attempt', 'question', 'selected_choice', 'is_correct', 'time_taken']
     list_filter = ['is_correct', 'attempt__quiz']
     search_fields = ['attempt__user__username', 'question__question_text']
+
+
+@admin.register(UserScoreSummary)
+class UserScoreSummaryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'total_score', 'total_attempts', 'avg_score', 'best_percentage', 'updated_at']
+    search_fields = ['user__username']
+    readonly_fields = [
+        'user', 'total_score', 'total_attempts', 'avg_score', 'best_percentage', 'percentage_sum', 'updated_at',
+    ]
+
+
+@admin.register(UserCategorySummary)
+class UserCategorySummaryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'category', 'total_attempts', 'best_percentage']
+    list_filter = ['category']
+    search_fields = ['user__username']
+    readonly_fields = ['user', 'category', 'total_attempts', 'best_percentage', 'percentage_sum']
@@ -0,0 +1,152 @@
+"""
+State of in-progress quiz attempts.
+
+Which attempt a user is taking, its questions and their position used to
+live in the session, so every quiz step rewrote the user's django_session
+row. The state now lives in the cache, one entry per user and quiz:
+
+    {'attempt_id': 12, 'seed': 814127, 'content_version': 3, 'question_ids': [4, 9, 2],
+     'max_score': 6, 'started_at': datetime(...), 'current_question': 1}
+
+Starting a quiz only creates this entry; ``attempt_id`` stays None and no
+QuizAttempt row is written until the first answer arrives, so users who
+look at a quiz and walk away leave nothing behind in the database. A user
+has at most one open attempt per quiz and starting the quiz again resumes
+it.
+
+An unsaved attempt exists only in the cache, so this needs a cache every
+worker shares (``CACHE_BACKEND`` file, db or redis). With the per-process
+local-memory cache the next request can land on a worker that never saw
+the attempt, so there the row is saved when the quiz starts instead.
+
+The question ids are only a convenience copy for the cache. Once saved the
+attempt row is the durable state: its seed regenerates the layout
+(quiz/layouts.py) and answered_count tracks progress, so if the cache entry
+is lost (eviction, or a worker restart with the local-memory cache) the
+state is rebuilt from the user's open attempt at that quiz. Completing an
+attempt writes through to the database and drops the entry.
+"""
+
+from datetime import timedelta
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .layouts import attempt_question_ids
+from .models import QuizAttempt
+
+
+STATE_CACHE_KEY = 'attempt_state:{user_id}:{quiz_id}'
+STATE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _key(user_id, quiz_id):
+    return STATE_CACHE_KEY.format(user_id=user_id, quiz_id=quiz_id)
+
+
+def cache_is_shared():
+    """Whether every worker process reads the same cache."""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def _state_from_attempt(attempt, question_ids):
+    return {
+        'attempt_id': attempt.id,
+        'seed': attempt.seed,
+        'content_version': attempt.content_version,
+        'question_ids': question_ids,
+        'max_score': attempt.max_score,
+        'started_at': attempt.started_at,
+        'current_question': min(attempt.answered_count, len(question_ids) - 1),
+    }
+
+
+def start_attempt_state(user_id, quiz, seed, question_ids, max_score):
+    """
+    Start a new attempt of a user at a quiz. It is saved once its first
+    answer arrives, or right away when the cache is not shared.
+    """
+    state = {
+        'attempt_id': None,
+        'seed': seed,
+        'content_version': quiz.content_version,
+        'question_ids': list(question_ids),
+        'max_score': max_score,
+        'started_at': timezone.now(),
+        'current_question': 0,
+    }
+    if cache_is_shared():
+        cache.set(_key(user_id, quiz.id), state, STATE_CACHE_TIMEOUT)
+    else:
+        save_attempt(user_id, quiz.id, state)
+    return state
+
+
+def get_attempt_state(user_id, quiz_id):
+    """The in-progress attempt state of a user at a quiz, or None."""
+    key = _key(user_id, quiz_id)
+    state = cache.get(key)
+    if state is None:
+        attempt = QuizAttempt.objects.filter(
+            user_id=user_id, quiz_id=quiz_id, is_completed=False
+        ).select_related('quiz').first()
+        if attempt is None:
+            return None
+        question_ids = attempt_question_ids(attempt)
+        if not question_ids:
+            return None
+        state = _state_from_attempt(attempt, question_ids)
+        cache.set(key, state, STATE_CACHE_TIMEOUT)
+    return state
+
+
+def save_attempt(user_id, quiz_id, state):
+    """
+    Return the QuizAttempt of a state, creating the row the first time an
+    attempt receives answers.
+
+    If another request saved an open attempt of the same user and quiz in
+    the meantime (two tabs answering at once), that attempt is used instead
+    and the state is switched over to it.
+    """
+    if state['attempt_id'] is not None:
+        return QuizAttempt(id=state['attempt_id'], user_id=user_id, quiz_id=quiz_id)
+
+    try:
+        with transaction.atomic():
+            attempt = QuizAttempt.objects.create(
+                user_id=user_id,
+                quiz_id=quiz_id,
+                started_at=state['started_at'],
+                total_questions=len(state['question_ids']),
+                max_score=state['max_score'],
+                seed=state['seed'],
+                content_version=state['content_version'],
+                time_taken=timedelta(0),
+            )
+    except IntegrityError:
+        attempt = QuizAttempt.objects.select_related('quiz').get(
+            user_id=user_id, quiz_id=quiz_id, is_completed=False
+        )
+        state.update(_state_from_attempt(attempt, attempt_question_ids(attempt)))
+    else:
+        state['attempt_id'] = attempt.id
+    cache.set(_key(user_id, quiz_id), state, STATE_CACHE_TIMEOUT)
+    return attempt
+
+
+def set_current_question(user_id, quiz_id, state, current_question):
+    state['current_question'] = current_question
+    cache.set(_key(user_id, quiz_id), state, STATE_CACHE_TIMEOUT)
+
+
+def clear_attempt_state(user_id, quiz_id):
+    cache.delete(_key(user_id, quiz_id))
+
+
+def clear_attempt_states(pairs):
+    """Drop the state of many ``(user_id, quiz_id)`` pairs at once."""
+    cache.delete_many([_key(user_id, quiz_id) for user_id, quiz_id in pairs])
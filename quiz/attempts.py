@@ -0,0 +1,136 @@
+"""
+Recording answers and finishing quiz attempts.
+
+Shared by the page-per-question flow in ``submit_quiz`` and the JSON
+attempt API used by play mode.
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .leaderboard import record_completed_attempt
+from .models import Choice, QuizAttempt, UserAnswer
+from .packed_answers import pack_attempts
+
+
+class InvalidAnswer(ValueError):
+    pass
+
+
+def parse_answers(items):
+    """
+    Turn submitted answers into ``(question_id, choice_id, time_taken)``
+    tuples. ``items`` is a list of dicts with those keys.
+    """
+    if not isinstance(items, list):
+        raise InvalidAnswer('answers must be a list')
+    answers = []
+    for item in items:
+        try:
+            answers.append((
+                int(item['question_id']),
+                int(item['choice_id']),
+                max(int(item.get('time_taken', 0)), 0),
+            ))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise InvalidAnswer(f'invalid answer: {item!r}')
+    return answers
+
+
+def save_answers(attempt, answers, question_ids=None):
+    """
+    Grade and store answers for an attempt, and move the attempt's running
+    score and answered count by the difference.
+
+    Each choice must belong to its question, and when ``question_ids`` is
+    given the question must be one of them. All choices are checked with one
+    query and all rows are written with one upsert, replacing answers already
+    stored for a question. Call it with the attempt row locked, as
+    ``submit_answers`` does, so concurrent changes cannot be counted twice.
+    """
+    if question_ids is not None:
+        allowed = set(question_ids)
+        for question_id, _, _ in answers:
+            if question_id not in allowed:
+                raise InvalidAnswer(f'question {question_id} is not part of this attempt')
+
+    choices = {
+        choice_id: (question_id, is_correct, points)
+        for choice_id, question_id, is_correct, points in Choice.objects.filter(
+            id__in=[choice_id for _, choice_id, _ in answers]
+        ).values_list('id', 'question_id', 'is_correct', 'question__points')
+    }
+    for question_id, choice_id, _ in answers:
+        if choices.get(choice_id, (None,))[0] != question_id:
+            raise InvalidAnswer(f'choice {choice_id} does not belong to question {question_id}')
+
+    # Later answers to the same question win; an upsert cannot touch the
+    # same row twice in one statement.
+    latest = {question_id: (choice_id, time_taken) for question_id, choice_id, time_taken in answers}
+    previous = dict(
+        UserAnswer.objects.filter(attempt=attempt, question_id__in=latest).values_list('question_id', 'is_correct')
+    )
+
+    rows = []
+    score_change = 0
+    for question_id, (choice_id, time_taken) in latest.items():
+        _, is_correct, points = choices[choice_id]
+        score_change += (points if is_correct else 0) - (points if previous.get(question_id) else 0)
+        rows.append(UserAnswer(
+            attempt=attempt,
+            question_id=question_id,
+            selected_choice_id=choice_id,
+            is_correct=is_correct,
+            time_taken=time_taken,
+        ))
+    # MySQL upserts on any unique key and does not accept unique_fields
+    unique_fields = ['attempt', 'question'] if connection.features.supports_update_conflicts_with_target else None
+    UserAnswer.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=['selected_choice', 'is_correct', 'time_taken'],
+    )
+
+    answered_change = len(latest) - len(previous)
+    if score_change or answered_change:
+        QuizAttempt.objects.filter(pk=attempt.pk).update(
+            score=F('score') + score_change,
+            answered_count=F('answered_count') + answered_change,
+        )
+
+
+def submit_answers(attempt, answers, question_ids=None, final=False):
+    """
+    Store a batch of answers and, for a final submission, complete the
+    attempt in the same transaction. Returns False if the attempt was already
+    completed by a concurrent request.
+    """
+    with transaction.atomic():
+        attempt = QuizAttempt.objects.select_for_update().get(pk=attempt.pk)
+        if attempt.is_completed:
+            return False
+        if answers:
+            save_answers(attempt, answers, question_ids=question_ids)
+        if final:
+            finish_attempt(attempt)
+    return True
+
+
+def finish_attempt(attempt):
+    """
+    Mark an attempt completed. The score is already up to date, it is kept
+    by ``save_answers`` as answers come in. With PACK_COMPLETED_ANSWERS the
+    answers are packed into the attempt row.
+    """
+    with transaction.atomic():
+        attempt.refresh_from_db(fields=['score', 'answered_count'])
+        attempt.is_completed = True
+        attempt.completed_at = timezone.now()
+        attempt.time_taken = attempt.completed_at - attempt.started_at
+        attempt.save(update_fields=['is_completed', 'completed_at', 'time_taken'])
+        record_completed_attempt(attempt)
+        if settings.PACK_COMPLETED_ANSWERS:
+            pack_attempts([attempt.pk])
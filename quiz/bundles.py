@@ -0,0 +1,111 @@
+"""
+Cached, read-only "bundles" of quiz content used to serve questions.
+
+A bundle is plain data (dicts and lists) so it can be cached and rendered
+without touching the database. Correct answers are never included.
+
+Every cache key embeds the quiz's content version. Saving or deleting a
+quiz, question or choice bumps the version, which makes all older bundle
+entries unreachable at once, and records when it happened for the
+Last-Modified header of the quiz's pages.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+
+VERSION_CACHE_KEY = 'quiz:{quiz_id}:content_version'
+CHANGED_AT_CACHE_KEY = 'quiz:{quiz_id}:content_changed_at'
+BUNDLE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_content_version(quiz_id):
+    key = VERSION_CACHE_KEY.format(quiz_id=quiz_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from a timestamp rather than 1 so that a version lost to cache
+        # eviction can never collide with one that is still cached.
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_content_version(quiz_id):
+    key = VERSION_CACHE_KEY.format(quiz_id=quiz_id)
+    cache.set(CHANGED_AT_CACHE_KEY.format(quiz_id=quiz_id), timezone.now(), None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return get_content_version(quiz_id)
+
+
+def get_content_changed_at(quiz_id):
+    """When the content of a quiz last changed, as far as the cache knows."""
+    key = CHANGED_AT_CACHE_KEY.format(quiz_id=quiz_id)
+    changed_at = cache.get(key)
+    if changed_at is None:
+        # Lost to eviction: now is the only time known not to be too early
+        changed_at = timezone.now()
+        if not cache.add(key, changed_at, None):
+            changed_at = cache.get(key, changed_at)
+    return changed_at
+
+
+def _bundle_key(quiz_id, name):
+    return f'quiz:{quiz_id}:v{get_content_version(quiz_id)}:{name}'
+
+
+def get_quiz_bundle(quiz_id):
+    """Return the quiz header as a dict, or None if the quiz does not exist."""
+    key = _bundle_key(quiz_id, 'header')
+    bundle = cache.get(key)
+    if bundle is None:
+        from .models import Quiz
+
+        bundle = Quiz.objects.filter(id=quiz_id).values(
+            'id', 'title', 'description', 'category_id', 'difficulty',
+            'time_limit', 'questions_count', 'is_active', 'created_at',
+        ).first()
+        if bundle is None:
+            return None
+        cache.set(key, bundle, BUNDLE_CACHE_TIMEOUT)
+    return bundle
+
+
+def get_question_bundles(quiz_id, question_ids):
+    """
+    Return ``{question_id: bundle}`` for the given questions of a quiz.
+
+    Missing entries are built with two queries in total, however many
+    questions are missing. Ids that do not belong to the quiz are left out.
+    """
+    keys = {_bundle_key(quiz_id, f'question:{question_id}'): question_id for question_id in question_ids}
+    cached = cache.get_many(keys)
+    bundles = {keys[key]: bundle for key, bundle in cached.items()}
+
+    missing = [question_id for question_id in question_ids if question_id not in bundles]
+    if missing:
+        from .models import Choice, Question
+
+        rows = Question.objects.filter(quiz_id=quiz_id, id__in=missing).values(
+            'id', 'question_text', 'question_type', 'points', 'time_limit', 'is_active',
+        )
+        built = {row['id']: dict(row, choices=[]) for row in rows}
+        choices = Choice.objects.filter(question_id__in=built).order_by('id').values_list(
+            'question_id', 'id', 'choice_text',
+        )
+        for question_id, choice_id, choice_text in choices:
+            built[question_id]['choices'].append({'id': choice_id, 'choice_text': choice_text})
+        cache.set_many(
+            {_bundle_key(quiz_id, f'question:{question_id}'): bundle for question_id, bundle in built.items()},
+            BUNDLE_CACHE_TIMEOUT,
+        )
+        bundles.update(built)
+    return bundles
+
+
+def get_question_bundle(quiz_id, question_id):
+    return get_question_bundles(quiz_id, [question_id]).get(question_id)
@@ -0,0 +1,123 @@
+"""
+Caching of public pages.
+
+Anonymous GET responses of public views are cached whole, and expensive
+template fragments are cached for everyone. Both are keyed on a global
+"public version" that model signals bump whenever content shown on those
+pages changes, so nothing stale is served after an edit.
+
+Public pages also carry Cache-Control/Vary headers for reverse proxies, and
+``conditional_page`` answers revalidation requests with 304 Not Modified
+from cheap validators, before the view runs any of its queries.
+"""
+
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+
+PUBLIC_VERSION_KEY = 'public_pages:version'
+PUBLIC_CHANGED_AT_KEY = 'public_pages:changed_at'
+PAGE_CACHE_KEY = 'public_pages:v{version}:{path}'
+
+
+def get_public_version():
+    version = cache.get(PUBLIC_VERSION_KEY)
+    if version is None:
+        # A timestamp keeps a version lost to eviction from colliding with
+        # entries that are still cached
+        version = int(time.time() * 1000)
+        if not cache.add(PUBLIC_VERSION_KEY, version, None):
+            version = cache.get(PUBLIC_VERSION_KEY, version)
+    return version
+
+
+def bump_public_version():
+    cache.set(PUBLIC_CHANGED_AT_KEY, timezone.now(), None)
+    try:
+        return cache.incr(PUBLIC_VERSION_KEY)
+    except ValueError:
+        return get_public_version()
+
+
+def get_public_changed_at():
+    """When the public version was last bumped, as far as the cache knows."""
+    changed_at = cache.get(PUBLIC_CHANGED_AT_KEY)
+    if changed_at is None:
+        changed_at = timezone.now()
+        if not cache.add(PUBLIC_CHANGED_AT_KEY, changed_at, None):
+            changed_at = cache.get(PUBLIC_CHANGED_AT_KEY, changed_at)
+    return changed_at
+
+
+def cache_public_page(view):
+    """
+    Serve anonymous GET requests of ``view`` from the cache. Responses that
+    set cookies (CSRF, messages) and requests carrying pending messages are
+    never cached.
+
+    Anonymous responses may be cached by proxies for a short while; pages for
+    logged-in users are private and must be revalidated.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated or 'messages' in request.COOKIES:
+            response = view(request, *args, **kwargs)
+        else:
+            key = PAGE_CACHE_KEY.format(version=get_public_version(), path=request.get_full_path())
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming and not response.cookies:
+                    cache.set(key, response, settings.PUBLIC_PAGE_CACHE_TIMEOUT)
+        return _patch_public_headers(request, response)
+    return wrapper
+
+
+def _patch_public_headers(request, response):
+    patch_vary_headers(response, ['Cookie'])
+    if request.user.is_authenticated or response.cookies:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.PUBLIC_PROXY_CACHE_TIMEOUT)
+    return response
+
+
+def conditional_page(etag_parts, last_modified=None):
+    """
+    Like Django's ``condition`` decorator, for public pages.
+
+    ``etag_parts(request, *args, **kwargs)`` returns values that change
+    whenever the page would; they are hashed together with the user and the
+    query string into the ETag. Requests carrying pending messages are
+    always rendered.
+    """
+    def etag_func(request, *args, **kwargs):
+        if 'messages' in request.COOKIES:
+            return None
+        parts = [request.user.pk, request.GET.urlencode(), *etag_parts(request, *args, **kwargs)]
+        return hashlib.md5(repr(parts).encode()).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        if last_modified is None or 'messages' in request.COOKIES:
+            return None
+        return last_modified(request, *args, **kwargs)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code == 304:
+                _patch_public_headers(request, response)
+            return response
+        return wrapper
+    return decorator
+
@@ -0,0 +1,11 @@
+from django.conf import settings
+
+from .caching import get_public_version
+
+
+def public_cache_version(request):
+    """Version and timeout for {% cache %} fragments of public pages."""
+    return {
+        'public_cache_version': get_public_version,
+        'public_cache_timeout': settings.PUBLIC_PAGE_CACHE_TIMEOUT,
+    }
@@ -0,0 +1,62 @@
+"""
+Denormalized question counters on Quiz.
+
+``Quiz.active_question_count`` and ``Quiz.total_points`` are adjusted with
+F() expressions whenever a question is created, deleted, toggled or moved,
+inside the transaction of that change. ``recompute_question_counters``
+repairs them after bulk operations that bypass model signals.
+"""
+
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Quiz
+
+
+UNKNOWN = object()
+
+
+def apply_question_change(old_state, new_state):
+    """
+    Move a question's contribution from ``old_state`` to ``new_state``, both
+    as returned by ``Question.counter_state()``.
+    """
+    if old_state == new_state:
+        return
+    if old_state is not None:
+        quiz_id, points = old_state
+        Quiz.objects.filter(pk=quiz_id).update(
+            active_question_count=F('active_question_count') - 1,
+            total_points=F('total_points') - points,
+        )
+    if new_state is not None:
+        quiz_id, points = new_state
+        Quiz.objects.filter(pk=quiz_id).update(
+            active_question_count=F('active_question_count') + 1,
+            total_points=F('total_points') + points,
+        )
+
+
+def recompute_question_counters(quiz_ids=None, batch_size=500):
+    """Recompute the counters from the questions table; returns quizzes updated."""
+    quizzes = Quiz.objects.order_by('pk')
+    if quiz_ids is not None:
+        quizzes = quizzes.filter(pk__in=quiz_ids)
+    active = Q(questions__is_active=True)
+    quizzes = quizzes.annotate(
+        counted_questions=Count('questions', filter=active),
+        counted_points=Coalesce(Sum('questions__points', filter=active), 0),
+    ).only('pk', *Quiz.COUNTER_FIELDS)
+
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(quizzes.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return updated
+        last_pk = batch[-1].pk
+        for quiz in batch:
+            quiz.active_question_count = quiz.counted_questions
+            quiz.total_points = quiz.counted_points
+        Quiz.objects.bulk_update(batch, Quiz.COUNTER_FIELDS)
+        updated += len(batch)
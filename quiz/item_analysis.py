@@ -0,0 +1,203 @@
+"""
+Item analysis of questions, computed in batches with NumPy.
+
+For every question: its p-value (fraction of right answers), its
+discrimination (point-biserial correlation between a right answer and the
+rest of the attempt's score, so the question does not correlate with
+itself), the mean, median and 90th percentile of ``time_taken`` and how
+often each choice was picked.
+
+Only completed attempts count. They are read a chunk at a time in
+``(completed_at, id)`` order and their answers are loaded into NumPy arrays
+(decoded from ``packed_answers`` where they are packed) and reduced per
+question with ``bincount``. QuestionStats keeps running
+sums rather than the figures alone, so each chunk is added to the stored
+sums together with the watermark (the last attempt counted) in one
+transaction: the next run starts after the watermark and an interrupted run
+loses nothing.
+"""
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Question, QuestionStats, QuestionStatsWatermark, QuizAttempt, UserAnswer
+from .packed_answers import unpack_answers
+
+
+COUNT_FIELDS = ('answer_count', 'correct_count', 'paired_count', 'paired_correct_count', 'time_sum')
+SCORE_SUM_FIELDS = ('rest_score_sum', 'rest_score_square_sum', 'correct_rest_score_sum')
+DERIVED_FIELDS = ('p_value', 'discrimination', 'time_mean', 'time_median', 'time_p90')
+ANSWER_FIELDS = ('attempt_id', 'question_id', 'selected_choice_id', 'is_correct', 'time_taken')
+
+
+def reset_question_stats():
+    """Forget every statistic, the next update reads all completed attempts again."""
+    with transaction.atomic():
+        QuestionStats.objects.all().delete()
+        QuestionStatsWatermark.objects.update_or_create(pk=1, defaults={'completed_at': None, 'attempt_id': 0})
+
+
+def update_chunk(until, chunk_size=2000):
+    """
+    Add the next ``chunk_size`` completed attempts after the watermark, up to
+    ``until``, to the question stats. Returns ``(attempts, answers)`` counted,
+    ``(0, 0)`` once there is nothing left.
+    """
+    QuestionStatsWatermark.objects.get_or_create(pk=1)
+    with transaction.atomic():
+        # Locking the watermark keeps concurrent runs from counting a chunk twice
+        watermark = QuestionStatsWatermark.objects.select_for_update().get(pk=1)
+        attempts = QuizAttempt.objects.filter(is_completed=True, completed_at__lte=until)
+        if watermark.completed_at is not None:
+            attempts = attempts.filter(
+                Q(completed_at__gt=watermark.completed_at)
+                | Q(completed_at=watermark.completed_at, id__gt=watermark.attempt_id)
+            )
+        attempts = list(attempts.order_by('completed_at', 'id').values_list(
+            'id', 'completed_at', 'score', 'max_score', 'total_questions', 'packed_answers',
+        )[:chunk_size])
+        if not attempts:
+            return 0, 0
+
+        packed = {attempt[0]: attempt[-1] for attempt in attempts if attempt[-1] is not None}
+        answers = list(UserAnswer.objects.filter(
+            attempt_id__in=[attempt[0] for attempt in attempts if attempt[0] not in packed]
+        ).values_list(*ANSWER_FIELDS))
+        for attempt_id, data in packed.items():
+            answers.extend((attempt_id, *answer) for answer in unpack_answers(data))
+        # Packed answers can outlive their question
+        points = dict(Question.objects.filter(
+            id__in={answer[1] for answer in answers}
+        ).values_list('id', 'points'))
+        answers = [answer for answer in answers if answer[1] in points]
+        if answers:
+            add_to_stats(*chunk_sums(attempts, answers, points))
+
+        watermark.attempt_id, watermark.completed_at = attempts[-1][:2]
+        watermark.save()
+    return len(attempts), len(answers)
+
+
+def chunk_sums(attempts, answers, points):
+    """
+    Reduce the answers of a chunk of attempts per question, ``points`` maps
+    question ids to their points. Returns the question ids, ``{sum field:
+    array}`` aligned with them, and ``{question id: {seconds: answers}}``
+    and ``{question id: {choice id: answers}}`` for the time histograms and
+    choice counts.
+    """
+    attempt_ids, _, scores, max_scores, total_questions, _ = zip(*attempts)
+    attempt_ids, scores, max_scores, total_questions = (
+        np.array(column) for column in (attempt_ids, scores, max_scores, total_questions)
+    )
+    table = np.array(
+        [(attempt, question, choice or 0, correct, seconds, points[question])
+         for attempt, question, choice, correct, seconds in answers],
+        dtype=np.int64,
+    )
+    answer_attempts, question_ids, choice_ids, correct, seconds, question_points = table.T
+
+    # Row of each answer's attempt
+    order = np.argsort(attempt_ids)
+    rows = order[np.searchsorted(attempt_ids, answer_attempts, sorter=order)]
+    # Attempts from before points-weighted scoring count one point per question
+    weighted = max_scores[rows] > 0
+    possible = np.where(weighted, max_scores[rows], total_questions[rows])
+    points = np.where(weighted, question_points, 1)
+    rest_possible = possible - points
+    paired = rest_possible > 0
+    rest_score = np.zeros(len(table))
+    np.divide(scores[rows] - points * correct, rest_possible, out=rest_score, where=paired)
+    # Points edited since the attempt can push the rest outside [0, 1]
+    rest_score = np.clip(rest_score, 0, 1)
+
+    questions, index = np.unique(question_ids, return_inverse=True)
+
+    def per_question(weights=None):
+        return np.bincount(index, weights=weights, minlength=len(questions))
+
+    sums = {
+        'answer_count': per_question(),
+        'correct_count': per_question(correct),
+        'paired_count': per_question(paired),
+        'paired_correct_count': per_question(paired & (correct == 1)),
+        'rest_score_sum': per_question(rest_score),
+        'rest_score_square_sum': per_question(rest_score ** 2),
+        'correct_rest_score_sum': per_question(rest_score * correct),
+        'time_sum': per_question(seconds),
+    }
+    return questions, sums, _pair_counts(questions, index, seconds), _pair_counts(
+        questions, index[choice_ids > 0], choice_ids[choice_ids > 0],
+    )
+
+
+def _pair_counts(questions, index, values):
+    """``{question id: {value: occurrences}}`` of (question index, value) pairs."""
+    counts = {}
+    if len(index):
+        pairs, occurrences = np.unique(np.stack([index, values], axis=1), axis=0, return_counts=True)
+        for (position, value), occurrence in zip(pairs.tolist(), occurrences.tolist()):
+            counts.setdefault(int(questions[position]), {})[str(value)] = occurrence
+    return counts
+
+
+def add_to_stats(questions, sums, time_histograms, choice_counts):
+    question_ids = questions.tolist()
+    existing = QuestionStats.objects.select_for_update().in_bulk(question_ids, field_name='question_id')
+    stats = [existing.get(question_id) or QuestionStats(question_id=question_id) for question_id in question_ids]
+
+    for position, item in enumerate(stats):
+        for field in COUNT_FIELDS:
+            setattr(item, field, getattr(item, field) + round(sums[field][position].item()))
+        for field in SCORE_SUM_FIELDS:
+            setattr(item, field, getattr(item, field) + sums[field][position].item())
+        _merge_counts(item.time_histogram, time_histograms.get(item.question_id, {}))
+        _merge_counts(item.choice_counts, choice_counts.get(item.question_id, {}))
+    derive_stats(stats)
+
+    QuestionStats.objects.bulk_update(
+        [item for item in stats if item.pk is not None],
+        COUNT_FIELDS + SCORE_SUM_FIELDS + DERIVED_FIELDS + ('time_histogram', 'choice_counts'),
+    )
+    QuestionStats.objects.bulk_create([item for item in stats if item.pk is None])
+
+
+def _merge_counts(counts, new):
+    for key, value in new.items():
+        counts[key] = counts.get(key, 0) + value
+
+
+def derive_stats(stats):
+    """Compute the figures shown to teachers from the running sums, for many questions at once."""
+    def column(field):
+        return np.array([getattr(item, field) for item in stats], dtype=float)
+
+    answers = column('answer_count')
+    paired = column('paired_count')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_values = column('correct_count') / answers
+        time_means = column('time_sum') / answers
+        # Pearson correlation of the right/wrong indicator with the rest score
+        p = column('paired_correct_count') / paired
+        mean_rest = column('rest_score_sum') / paired
+        rest_variance = column('rest_score_square_sum') / paired - mean_rest ** 2
+        covariance = column('correct_rest_score_sum') / paired - p * mean_rest
+        discrimination = covariance / np.sqrt(p * (1 - p) * rest_variance)
+    defined = (p > 0) & (p < 1) & (rest_variance > 1e-12)
+
+    for position, item in enumerate(stats):
+        item.p_value = p_values[position].item() if answers[position] else None
+        item.time_mean = time_means[position].item() if answers[position] else None
+        item.discrimination = discrimination[position].item() if defined[position] else None
+        item.time_median, item.time_p90 = histogram_percentiles(item.time_histogram, (0.5, 0.9))
+
+
+def histogram_percentiles(histogram, fractions):
+    """Exact percentiles of ``{value: occurrences}`` (nearest rank)."""
+    if not histogram:
+        return [None] * len(fractions)
+    values = sorted(histogram, key=int)
+    cumulative = np.cumsum([histogram[value] for value in values])
+    ranks = np.maximum(np.ceil(np.array(fractions) * cumulative[-1]), 1)
+    return [float(values[position]) for position in np.searchsorted(cumulative, ranks)]
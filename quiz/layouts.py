@@ -0,0 +1,50 @@
+"""
+Seeded attempt layouts.
+
+An attempt stores a random seed and the quiz's content version instead of
+its list of questions. The questions drawn and the order of each
+question's choices are regenerated from the seed whenever they are needed,
+so the stored state stays a few bytes however many questions there are.
+
+The layout is exact as long as the quiz's content version still matches.
+If questions were added, removed or toggled since the attempt started, the
+layout is regenerated from the current question bank. Answers already given
+are still graded and shown from their UserAnswer rows.
+"""
+
+import random
+
+from django.db.models import F
+
+from .sampling import sample_question_ids
+
+
+def new_seed():
+    return random.SystemRandom().getrandbits(62)
+
+
+def layout_question_ids(quiz, seed, count):
+    """The ordered question ids of an attempt with this seed."""
+    return sample_question_ids(quiz.id, count, stratified=quiz.stratify_by_points, rng=random.Random(seed))
+
+
+def attempt_question_ids(attempt):
+    return layout_question_ids(attempt.quiz, attempt.seed, attempt.total_questions)
+
+
+def is_layout_current(attempt):
+    return attempt.content_version == attempt.quiz.content_version
+
+
+def shuffle_choices(bundle, seed):
+    """A copy of a question bundle with its choices in this seed's order."""
+    choices = list(bundle['choices'])
+    random.Random(f"{seed}:{bundle['id']}").shuffle(choices)
+    return dict(bundle, choices=choices)
+
+
+def bump_layout_version(quiz_id):
+    """Record that the question bank of a quiz changed."""
+    from .models import Quiz
+
+    Quiz.objects.filter(pk=quiz_id).update(content_version=F('content_version') + 1)
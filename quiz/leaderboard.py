@@ -0,0 +1,598 @@
+"""
+Leaderboard bookkeeping.
+
+Completed attempts are folded into precomputed structures when they finish,
+so leaderboard pages only read a small, indexed slice instead of aggregating
+over every QuizAttempt:
+
+* ``UserScoreSummary`` rows back the global leaderboard and, together with
+  ``UserCategorySummary``, the statistics on a user's My Results page.
+* ``QuizRanking`` keeps each user's best attempt at a quiz in sorted order,
+  split into cache blocks so reads and updates touch a few small values. It
+  is rebuilt from the database, by one worker at a time, when missing.
+* ``ScoreRollup`` rows bucket scores per user, quiz and local day. Daily,
+  weekly and monthly leaderboards merge at most a month of buckets; the
+  merged boards are cached until an attempt is completed, or for
+  ``PERIOD_BOARD_TIMEOUT`` seconds.
+"""
+
+import time
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, FloatField, Max, Sum, Value
+from django.db.models.functions import Cast, Greatest
+from django.utils import timezone
+
+from .caching import get_public_version
+from .models import Quiz, QuizAttempt, ScoreRollup, UserCategorySummary, UserScoreSummary
+
+
+RANKING_CACHE_KEY = 'quiz:{quiz_id}:ranking'
+RANKING_PART_KEY = 'quiz:{quiz_id}:ranking:{generation}:{part}'
+RANKING_LOCK_KEY = 'quiz:{quiz_id}:ranking:lock'
+RANKING_BUILD_LOCK_KEY = 'quiz:{quiz_id}:ranking:build'
+RANKING_PENDING_KEY = 'quiz:{quiz_id}:ranking:pending'
+RANKING_CACHE_TIMEOUT = 60 * 60 * 24
+RANKING_BLOCK_SIZE = 512
+# Seconds replaced blocks stay readable for requests holding an older index
+RANKING_GRACE_TIMEOUT = 60
+RANKING_LOCK_TIMEOUT = 10
+RANKING_BUILD_TIMEOUT = 60
+
+CHANGED_AT_CACHE_KEY = 'leaderboard:{scope}:changed_at'
+PERIOD_BOARD_CACHE_KEY = 'leaderboard:{scope}:{period}:{start}:v{version}'
+PERIOD_BOARD_TIMEOUT = 60 * 5
+# Rows kept per cached period board, longer boards are read directly
+PERIOD_BOARD_SIZE = 100
+
+PERIOD_CHOICES = [
+    ('day', 'Today'),
+    ('week', 'This week'),
+    ('month', 'This month'),
+]
+
+
+def record_completed_attempt(attempt):
+    """Add a newly completed attempt to the precomputed leaderboards and summaries."""
+    percentage = attempt.get_percentage()
+    summary, created = UserScoreSummary.objects.get_or_create(
+        user_id=attempt.user_id,
+        defaults={
+            'total_score': attempt.score,
+            'total_attempts': 1,
+            'avg_score': attempt.score,
+            'best_percentage': percentage,
+            'percentage_sum': percentage,
+        }
+    )
+    if not created:
+        UserScoreSummary.objects.filter(pk=summary.pk).update(
+            total_score=F('total_score') + attempt.score,
+            total_attempts=F('total_attempts') + 1,
+            avg_score=Cast(F('total_score') + attempt.score, FloatField()) / (F('total_attempts') + 1),
+            best_percentage=Greatest('best_percentage', Value(percentage)),
+            percentage_sum=F('percentage_sum') + percentage,
+        )
+    update_category_summary(attempt, percentage)
+    update_score_rollup(attempt)
+    transaction.on_commit(lambda: update_quiz_ranking(attempt))
+
+
+def get_leaderboard_changed_at(quiz_id=None):
+    """
+    When completed attempts (of one quiz, or of any quiz) last changed. Used
+    as the Last-Modified validator of leaderboard pages.
+    """
+    key = CHANGED_AT_CACHE_KEY.format(scope=quiz_id or 'all')
+    changed_at = cache.get(key)
+    if changed_at is None:
+        attempts = QuizAttempt.objects.filter(is_completed=True)
+        if quiz_id is not None:
+            attempts = attempts.filter(quiz_id=quiz_id)
+        changed_at = attempts.aggregate(latest=Max('completed_at'))['latest'] or timezone.now()
+        cache.add(key, changed_at, None)
+    return changed_at
+
+
+def touch_leaderboards(quiz_id):
+    now = timezone.now()
+    cache.set_many({
+        CHANGED_AT_CACHE_KEY.format(scope='all'): now,
+        CHANGED_AT_CACHE_KEY.format(scope=quiz_id): now,
+    }, None)
+    cache.delete_many([
+        _period_board_key(scope, period)
+        for scope in ('all', quiz_id) for period, _ in PERIOD_CHOICES
+    ])
+
+
+def update_category_summary(attempt, percentage):
+    category_id = Quiz.objects.filter(pk=attempt.quiz_id).values_list('category_id', flat=True).get()
+    summary, created = UserCategorySummary.objects.get_or_create(
+        user_id=attempt.user_id,
+        category_id=category_id,
+        defaults={
+            'total_attempts': 1,
+            'best_percentage': percentage,
+            'percentage_sum': percentage,
+        }
+    )
+    if not created:
+        UserCategorySummary.objects.filter(pk=summary.pk).update(
+            total_attempts=F('total_attempts') + 1,
+            best_percentage=Greatest('best_percentage', Value(percentage)),
+            percentage_sum=F('percentage_sum') + percentage,
+        )
+
+
+def update_score_rollup(attempt):
+    day = timezone.localdate(attempt.completed_at)
+    rollup, created = ScoreRollup.objects.get_or_create(
+        user_id=attempt.user_id,
+        quiz_id=attempt.quiz_id,
+        day=day,
+        defaults={
+            'total_score': attempt.score,
+            'best_score': attempt.score,
+            'attempts': 1,
+        }
+    )
+    if not created:
+        ScoreRollup.objects.filter(pk=rollup.pk).update(
+            total_score=F('total_score') + attempt.score,
+            best_score=Greatest('best_score', attempt.score),
+            attempts=F('attempts') + 1,
+        )
+
+
+def period_range(period, today=None):
+    """
+    First and last local day of the current day, week (Monday to Sunday) or
+    month, using settings.TIME_ZONE.
+    """
+    today = today or timezone.localdate()
+    if period == 'day':
+        return today, today
+    if period == 'week':
+        start = today - timedelta(days=today.weekday())
+        return start, start + timedelta(days=6)
+    if period == 'month':
+        start = today.replace(day=1)
+        next_month = (start + timedelta(days=32)).replace(day=1)
+        return start, next_month - timedelta(days=1)
+    raise ValueError(f'unknown period: {period!r}')
+
+
+def _period_board_key(scope, period):
+    # The public version changes with renamed users, the start with the period
+    start, _ = period_range(period)
+    return PERIOD_BOARD_CACHE_KEY.format(scope=scope, period=period, start=start, version=get_public_version())
+
+
+def _cached_period_board(scope, period, limit, board):
+    """The first ``limit`` rows of ``board``, a queryset, cached as a list."""
+    if limit > PERIOD_BOARD_SIZE:
+        return list(board[:limit])
+    key = _period_board_key(scope, period)
+    rows = cache.get(key)
+    if rows is None:
+        rows = list(board[:PERIOD_BOARD_SIZE])
+        cache.set(key, rows, PERIOD_BOARD_TIMEOUT)
+    return rows[:limit]
+
+
+def get_period_top_users(period, limit=10):
+    """Global leaderboard for a period: total score across all quizzes."""
+    start, end = period_range(period)
+    board = ScoreRollup.objects.filter(day__range=(start, end)).values(
+        'user__username'
+    ).annotate(
+        total_score=Sum('total_score'),
+        total_attempts=Sum('attempts'),
+    ).order_by('-total_score', 'user__username')
+    return _cached_period_board('all', period, limit, board)
+
+
+def get_period_quiz_top(quiz_id, period, limit=10):
+    """Quiz leaderboard for a period: each user's best score on the quiz."""
+    start, end = period_range(period)
+    board = ScoreRollup.objects.filter(quiz_id=quiz_id, day__range=(start, end)).values(
+        'user__username'
+    ).annotate(
+        best_score=Max('best_score'),
+        total_attempts=Sum('attempts'),
+    ).order_by('-best_score', 'user__username')
+    return _cached_period_board(quiz_id, period, limit, board)
+
+
+def get_top_users(limit=10):
+    return UserScoreSummary.objects.order_by('-total_score').values(
+        'user__username', 'total_score', 'total_attempts', 'avg_score'
+    )[:limit]
+
+
+class RankingOutdated(Exception):
+    """A cached ranking part is missing or does not match the index that was read."""
+
+
+class LocalRankingStore(dict):
+    """Cache-like store for a ranking built for a single request."""
+
+    def get_many(self, keys):
+        return {key: self[key] for key in keys if key in self}
+
+    def set_many(self, values, timeout=None):
+        self.update(values)
+
+    def set(self, key, value, timeout=None):
+        self[key] = value
+
+    def touch(self, key, timeout=None):
+        pass
+
+
+class QuizRanking:
+    """
+    Best attempt per user for one quiz, ordered by score (highest first),
+    then time taken (fastest first), then attempt id.
+
+    Entries are ``(-score, seconds, attempt_id, user_id)`` tuples kept in
+    sorted blocks of at most ``2 * RANKING_BLOCK_SIZE`` entries, each block a
+    cache value of its own. A small index holds the first entry and size of
+    every block, and each user's entry sits in one of ``user_buckets`` dicts
+    (by ``user_id % user_buckets``). A rank, the top K or a user's
+    neighbours read the index, one user bucket and one or two blocks;
+    recording an attempt rewrites one bucket and the blocks it touches.
+
+    Changed blocks are written under new ids before the index that points to
+    them, and replaced ones expire after ``RANKING_GRACE_TIMEOUT``, so a
+    reader holding an older index still finds consistent blocks. Reads that
+    find a part missing reload the index, and rebuild it as a last resort.
+    """
+
+    def __init__(self, quiz_id, index=None, store=None):
+        self.quiz_id = quiz_id
+        self.key = RANKING_CACHE_KEY.format(quiz_id=quiz_id)
+        if index is None:
+            self._load()
+        else:
+            self._use(index, store if store is not None else cache)
+
+    def _use(self, index, store):
+        self.index = index
+        self.store = store
+        self._parts = {}
+        self.offsets = [0]
+        for _, _, count in index['blocks']:
+            self.offsets.append(self.offsets[-1] + count)
+
+    def _load(self):
+        """Read the index from the cache, building it first (behind a lock) when missing."""
+        lock_key = RANKING_BUILD_LOCK_KEY.format(quiz_id=self.quiz_id)
+        deadline = time.monotonic() + RANKING_BUILD_TIMEOUT
+        while True:
+            index = cache.get(self.key)
+            if index is not None:
+                return self._use(index, cache)
+            if cache.add(lock_key, True, RANKING_BUILD_TIMEOUT):
+                try:
+                    index = build_quiz_ranking(self.quiz_id)
+                finally:
+                    cache.delete(lock_key)
+                apply_pending_ranking_updates(self.quiz_id)
+                return self._use(cache.get(self.key) or index, cache)
+            if time.monotonic() > deadline:
+                # The build is stuck, answer this request without the cache
+                store = LocalRankingStore()
+                return self._use(build_quiz_ranking(self.quiz_id, store), store)
+            time.sleep(0.05)
+
+    def _reload(self, rebuild=False):
+        if rebuild and self.store is cache:
+            current = cache.get(self.key)
+            if current is not None and current['generation'] == self.index['generation']:
+                cache.delete(self.key)
+        self._load()
+
+    def _read(self, method, *args):
+        # Retry with a fresh index, then with a rebuilt one
+        for rebuild in (False, True):
+            try:
+                return method(*args)
+            except RankingOutdated:
+                if self.store is not cache:
+                    raise
+                self._reload(rebuild=rebuild)
+        return method(*args)
+
+    def _part_key(self, part):
+        return RANKING_PART_KEY.format(quiz_id=self.quiz_id, generation=self.index['generation'], part=part)
+
+    def _get_parts(self, parts):
+        missing = [part for part in parts if part not in self._parts]
+        if missing:
+            found = self.store.get_many([self._part_key(part) for part in missing])
+            for part in missing:
+                value = found.get(self._part_key(part))
+                if value is None:
+                    raise RankingOutdated(part)
+                self._parts[part] = value
+        return [self._parts[part] for part in parts]
+
+    def _user_entry(self, user_id):
+        bucket, = self._get_parts([f"users:{user_id % self.index['user_buckets']}"])
+        return bucket.get(user_id)
+
+    def _block_position(self, entry):
+        firsts = [first for _, first, _ in self.index['blocks']]
+        return max(bisect_right(firsts, entry) - 1, 0)
+
+    def _slice(self, start, stop):
+        """Entries ``start`` to ``stop`` (0-based, exclusive) in rank order."""
+        start, stop = max(start, 0), min(stop, len(self))
+        if start >= stop:
+            return []
+        first = bisect_right(self.offsets, start) - 1
+        last = bisect_left(self.offsets, stop)
+        blocks = self._get_parts([f'block:{block_id}' for block_id, _, _ in self.index['blocks'][first:last]])
+        entries = [entry for block in blocks for entry in block]
+        return entries[start - self.offsets[first]:stop - self.offsets[first]]
+
+    def _rank(self, user_id):
+        entry = self._user_entry(user_id)
+        if entry is None:
+            return None
+        position = self._block_position(entry)
+        block, = self._get_parts([f'block:{self.index["blocks"][position][0]}'])
+        offset = bisect_left(block, entry)
+        if offset == len(block) or block[offset] != entry:
+            # The bucket was updated after this index was read
+            raise RankingOutdated(user_id)
+        return self.offsets[position] + offset + 1
+
+    @staticmethod
+    def _entry(attempt_id, user_id, score, time_taken):
+        return (-score, time_taken.total_seconds(), attempt_id, user_id)
+
+    @staticmethod
+    def _rows(first_rank, entries):
+        return [
+            {
+                'rank': first_rank + offset,
+                'attempt_id': attempt_id,
+                'user_id': user_id,
+                'score': -neg_score,
+                'time_taken': timedelta(seconds=seconds),
+            }
+            for offset, (neg_score, seconds, attempt_id, user_id) in enumerate(entries)
+        ]
+
+    def __len__(self):
+        return self.index['total']
+
+    def top(self, k=10):
+        return self._rows(1, self._read(self._slice, 0, k))
+
+    def rank(self, user_id):
+        """1-based rank of a user, or None if they have no completed attempt."""
+        return self._read(self._rank, user_id)
+
+    def around(self, user_id, radius=2):
+        """The user's row plus up to ``radius`` rows either side of it."""
+        def around():
+            rank = self._rank(user_id)
+            if rank is None:
+                return []
+            start = max(rank - 1 - radius, 0)
+            return self._rows(start + 1, self._slice(start, rank + radius))
+        return self._read(around)
+
+    def submit(self, attempt_id, user_id, score, time_taken):
+        """
+        Record an attempt; returns True if it became the user's best. Callers
+        hold the ranking's update lock, see ``update_quiz_ranking``.
+        """
+        entry = self._entry(attempt_id, user_id, score, time_taken)
+        bucket_part = f"users:{user_id % self.index['user_buckets']}"
+        bucket, = self._get_parts([bucket_part])
+        current = bucket.get(user_id)
+        if current is not None and current <= entry:
+            return False
+
+        # [block id, entries (None while unchanged), first entry, count]
+        layout = [[block_id, None, first, count] for block_id, first, count in self.index['blocks']]
+
+        def entries_at(position):
+            if layout[position][1] is None:
+                block, = self._get_parts([f'block:{layout[position][0]}'])
+                layout[position][1] = list(block)
+            return layout[position][1]
+
+        if current is not None:
+            position = self._block_position(current)
+            entries = entries_at(position)
+            offset = bisect_left(entries, current)
+            if offset == len(entries) or entries[offset] != current:
+                raise RankingOutdated(user_id)
+            del entries[offset]
+            if entries:
+                layout[position][2:] = [entries[0], len(entries)]
+            else:
+                del layout[position]
+
+        if not layout:
+            layout.append([None, [entry], entry, 1])
+        else:
+            firsts = [first for _, _, first, _ in layout]
+            position = max(bisect_right(firsts, entry) - 1, 0)
+            entries = entries_at(position)
+            insort(entries, entry)
+            layout[position][2:] = [entries[0], len(entries)]
+            if len(entries) > 2 * RANKING_BLOCK_SIZE:
+                half = len(entries) // 2
+                layout.insert(position + 1, [None, entries[half:], entries[half], len(entries) - half])
+                del entries[half:]
+                layout[position][3] = half
+
+        # Changed blocks get new ids, the old ones stay readable for a while
+        next_block = self.index['next_block']
+        parts = {}
+        for row in layout:
+            if row[1] is not None:
+                row[0] = next_block
+                next_block += 1
+                parts[self._part_key(f'block:{row[0]}')] = row[1]
+        kept = {row[0] for row in layout}
+        replaced = [block_id for block_id, _, _ in self.index['blocks'] if block_id not in kept]
+        bucket = {**bucket, user_id: entry}
+        parts[self._part_key(bucket_part)] = bucket
+
+        index = dict(
+            self.index,
+            blocks=[(block_id, first, count) for block_id, _, first, count in layout],
+            next_block=next_block,
+            total=self.index['total'] + (current is None),
+        )
+        self.store.set_many(parts, RANKING_CACHE_TIMEOUT)
+        self.store.set(self.key, index, RANKING_CACHE_TIMEOUT)
+        for block_id in replaced:
+            self.store.touch(self._part_key(f'block:{block_id}'), RANKING_GRACE_TIMEOUT)
+        self._use(index, self.store)
+        return True
+
+
+def build_quiz_ranking(quiz_id, store=cache):
+    """Build a quiz's ranking from the database into ``store``; returns its index."""
+    entries = []
+    seen = set()
+    attempts = QuizAttempt.objects.filter(quiz_id=quiz_id, is_completed=True).order_by(
+        '-score', 'time_taken', 'id'
+    ).values_list('id', 'user_id', 'score', 'time_taken')
+    for attempt_id, user_id, score, time_taken in attempts.iterator(chunk_size=2000):
+        # Rows arrive best-first, so the first row per user is their best
+        if user_id not in seen:
+            seen.add(user_id)
+            entries.append(QuizRanking._entry(attempt_id, user_id, score, time_taken))
+    entries.sort()
+
+    generation = uuid.uuid4().hex[:12]
+    user_buckets = max(-(-len(entries) // RANKING_BLOCK_SIZE), 1)
+    parts = {}
+    blocks = []
+    for block_id, start in enumerate(range(0, len(entries), RANKING_BLOCK_SIZE)):
+        block = entries[start:start + RANKING_BLOCK_SIZE]
+        parts[f'block:{block_id}'] = block
+        blocks.append((block_id, block[0], len(block)))
+    buckets = [{} for _ in range(user_buckets)]
+    for entry in entries:
+        buckets[entry[3] % user_buckets][entry[3]] = entry
+    parts.update((f'users:{slot}', bucket) for slot, bucket in enumerate(buckets))
+
+    store.set_many({
+        RANKING_PART_KEY.format(quiz_id=quiz_id, generation=generation, part=part): value
+        for part, value in parts.items()
+    }, RANKING_CACHE_TIMEOUT)
+    index = {
+        'generation': generation,
+        'blocks': blocks,
+        'next_block': len(blocks),
+        'user_buckets': user_buckets,
+        'total': len(entries),
+    }
+    store.set(RANKING_CACHE_KEY.format(quiz_id=quiz_id), index, RANKING_CACHE_TIMEOUT)
+    return index
+
+
+def get_quiz_ranking(quiz_id):
+    return QuizRanking(quiz_id)
+
+
+def add_usernames(*row_lists):
+    """Fill in the usernames of ranking rows with one query, renames show up at once."""
+    rows = [row for row_list in row_lists for row in row_list]
+    usernames = dict(User.objects.filter(id__in={row['user_id'] for row in rows}).values_list('id', 'username'))
+    for row in rows:
+        row['username'] = usernames.get(row['user_id'], '')
+
+
+def invalidate_quiz_rankings(quiz_ids):
+    """
+    Drop cached rankings, after completed attempts were deleted or written
+    in bulk; the next read rebuilds them from the database. Each is dropped
+    holding its update lock, so an update in progress cannot write the old
+    index back afterwards.
+    """
+    for quiz_id in quiz_ids:
+        lock_key = RANKING_LOCK_KEY.format(quiz_id=quiz_id)
+        locked = _acquire(lock_key, RANKING_LOCK_TIMEOUT)
+        try:
+            cache.delete(RANKING_CACHE_KEY.format(quiz_id=quiz_id))
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+
+def _acquire(lock_key, wait):
+    deadline = time.monotonic() + wait
+    while not cache.add(lock_key, True, RANKING_LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def update_quiz_ranking(attempt):
+    """
+    Fold a completed attempt into the cached ranking of its quiz. Updates of
+    one quiz take turns on a lock. While the ranking is missing (being
+    built) the attempt is queued and applied once the build is done.
+    """
+    key = RANKING_CACHE_KEY.format(quiz_id=attempt.quiz_id)
+    lock_key = RANKING_LOCK_KEY.format(quiz_id=attempt.quiz_id)
+    if not _acquire(lock_key, RANKING_LOCK_TIMEOUT):
+        # Could not get in; the next read rebuilds it, behind the build lock
+        cache.delete(key)
+        return
+    try:
+        index = cache.get(key)
+        if index is None:
+            pending_key = RANKING_PENDING_KEY.format(quiz_id=attempt.quiz_id)
+            pending = cache.get(pending_key, [])
+            pending.append((attempt.id, attempt.user_id, attempt.score, attempt.time_taken))
+            cache.set(pending_key, pending, RANKING_BUILD_TIMEOUT * 2)
+            return
+        try:
+            QuizRanking(attempt.quiz_id, index).submit(attempt.id, attempt.user_id, attempt.score, attempt.time_taken)
+        except RankingOutdated:
+            cache.delete(key)
+    finally:
+        cache.delete(lock_key)
+
+
+def apply_pending_ranking_updates(quiz_id):
+    """Apply the attempts completed while a ranking was being built."""
+    key = RANKING_CACHE_KEY.format(quiz_id=quiz_id)
+    pending_key = RANKING_PENDING_KEY.format(quiz_id=quiz_id)
+    lock_key = RANKING_LOCK_KEY.format(quiz_id=quiz_id)
+    if not cache.get(pending_key) or not _acquire(lock_key, RANKING_LOCK_TIMEOUT):
+        return
+    try:
+        index = cache.get(key)
+        pending = cache.get(pending_key, [])
+        cache.delete(pending_key)
+        if index is None:
+            return
+        ranking = QuizRanking(quiz_id, index)
+        # Attempts the build already read are not better than themselves, so
+        # submitting them again changes nothing
+        for attempt_id, user_id, score, time_taken in pending:
+            ranking.submit(attempt_id, user_id, score, time_taken)
+    except RankingOutdated:
+        cache.delete(key)
+    finally:
+        cache.delete(lock_key)
@@ -0,0 +1,93 @@
+import gzip
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from quiz.attempt_state import clear_attempt_states
+from quiz.models import QuizAttempt, UserAnswer
+
+
+ATTEMPT_FIELDS = (
+    'id', 'user_id', 'quiz_id', 'score', 'max_score', 'total_questions', 'answered_count',
+    'seed', 'content_version', 'started_at',
+)
+ANSWER_FIELDS = ('attempt_id', 'question_id', 'selected_choice_id', 'is_correct', 'time_taken')
+
+
+class Command(BaseCommand):
+    help = 'Delete incomplete quiz attempts (and their answers) that were abandoned, optionally archiving them first'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=float, default=24,
+            help='Only remove attempts started more than this many hours ago (default: 24)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of attempts removed per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--archive', metavar='PATH',
+            help='Append the removed attempts and answers to this JSON lines file (gzipped if it ends in .gz)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the attempts that would be removed'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        cutoff = timezone.now() - timedelta(hours=options['older_than'])
+        stale = QuizAttempt.objects.filter(is_completed=False, started_at__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f'{stale.count()} abandoned attempts started before {cutoff:%Y-%m-%d %H:%M}')
+            return
+
+        archive = None
+        if options['archive']:
+            path = options['archive']
+            archive = gzip.open(path, 'at') if path.endswith('.gz') else open(path, 'a')
+
+        removed = 0
+        last_id = 0
+        try:
+            while True:
+                with transaction.atomic():
+                    attempts = list(
+                        stale.filter(id__gt=last_id).select_for_update().order_by('id')
+                        .values(*ATTEMPT_FIELDS)[:options['batch_size']]
+                    )
+                    if not attempts:
+                        break
+                    last_id = attempts[-1]['id']
+                    ids = [attempt['id'] for attempt in attempts]
+
+                    if archive is not None:
+                        self._archive(archive, attempts, ids)
+                    UserAnswer.objects.filter(attempt_id__in=ids).delete()
+                    QuizAttempt.objects.filter(id__in=ids).delete()
+
+                # Nobody can resume a deleted attempt from a cached state
+                clear_attempt_states((attempt['user_id'], attempt['quiz_id']) for attempt in attempts)
+                removed += len(attempts)
+                self.stdout.write(f'Removed {removed} attempts...')
+        finally:
+            if archive is not None:
+                archive.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} abandoned attempts'))
+
+    def _archive(self, archive, attempts, ids):
+        answers = {}
+        for answer in UserAnswer.objects.filter(attempt_id__in=ids).order_by('id').values(*ANSWER_FIELDS):
+            answers.setdefault(answer.pop('attempt_id'), []).append(answer)
+        for attempt in attempts:
+            record = dict(attempt, answers=answers.get(attempt['id'], []))
+            archive.write(json.dumps(record, cls=DjangoJSONEncoder) + '\n')
+        archive.flush()
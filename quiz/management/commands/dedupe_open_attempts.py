@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from quiz.attempt_state import clear_attempt_states
+from quiz.models import QuizAttempt
+
+
+class Command(BaseCommand):
+    help = (
+        'Keep only the most recently started open attempt of each user at each quiz and delete the others '
+        'with their answers. Run it before migrating to the one_open_attempt_per_quiz constraint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of (user, quiz) pairs cleaned up per transaction (default: 500)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the attempts that would be removed'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        # Only columns that predate the constraint are read, so this also
+        # runs against a database that has not been migrated yet
+        duplicated = QuizAttempt.objects.filter(is_completed=False).values('user_id', 'quiz_id').annotate(
+            open_attempts=Count('id')
+        ).filter(open_attempts__gt=1).order_by('user_id', 'quiz_id')
+
+        if options['dry_run']:
+            pairs = list(duplicated)
+            extra = sum(pair['open_attempts'] - 1 for pair in pairs)
+            self.stdout.write(f'{extra} duplicate open attempts of {len(pairs)} users and quizzes')
+            return
+
+        removed = 0
+        while True:
+            pairs = [(pair['user_id'], pair['quiz_id']) for pair in duplicated[:options['batch_size']]]
+            if not pairs:
+                break
+            with transaction.atomic():
+                ids = []
+                for user_id, quiz_id in pairs:
+                    open_ids = list(QuizAttempt.objects.select_for_update().filter(
+                        user_id=user_id, quiz_id=quiz_id, is_completed=False,
+                    ).order_by('-started_at', '-id').values_list('id', flat=True))
+                    ids.extend(open_ids[1:])
+                # Answers go with their attempts (on_delete=CASCADE)
+                QuizAttempt.objects.filter(id__in=ids).only('id', 'quiz_id', 'is_completed').delete()
+            clear_attempt_states(pairs)
+            removed += len(ids)
+            self.stdout.write(f'Removed {removed} attempts...')
+
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} duplicate open attempts'))
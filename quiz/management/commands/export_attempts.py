@@ -0,0 +1,62 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.results_export import FORMATS, STATUS_CHOICES, export_lines, filter_attempts
+from quiz.streaming import open_text
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}, use YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Export quiz attempts with one row per answer as CSV or JSON Lines, for analysis in a spreadsheet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quiz', type=int, action='append', dest='quiz_ids', help='Only this quiz (repeatable)')
+        parser.add_argument('--since', help='Only attempts started on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Only attempts started on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--status', choices=STATUS_CHOICES, default='all', help='Filter by completion (default: all)')
+        parser.add_argument(
+            '--output', '-o', default='-',
+            help='File to write; gzipped on the fly if it ends in .gz (default: stdout)'
+        )
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file extension, else csv)')
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of attempts read per query (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format']
+        if fmt is None:
+            fmt = 'jsonl' if output.removesuffix('.gz').endswith(('.jsonl', '.ndjson')) else 'csv'
+        attempts = filter_attempts(
+            quiz_ids=options['quiz_ids'],
+            since=parse_date(options['since']) if options['since'] else None,
+            until=parse_date(options['until']) if options['until'] else None,
+            status=options['status'],
+        )
+
+        lines = export_lines(attempts, fmt, chunk_size=options['chunk_size'])
+        if output == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        rows = 0
+        try:
+            with open_text(output, 'w') as stream:
+                for line in lines:
+                    stream.write(line)
+                    rows += 1
+        except OSError as exc:
+            raise CommandError(exc)
+        if fmt == 'csv':
+            rows -= 1
+        self.stdout.write(self.style.SUCCESS(f'Exported {rows} rows to {output}'))
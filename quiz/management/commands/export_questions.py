@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.models import Question
+from quiz.question_bank import FORMATS, detect_format, export_lines
+from quiz.streaming import open_text
+
+
+class Command(BaseCommand):
+    help = 'Export questions and choices as a JSON Lines or CSV question bank that import_questions can read'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_ids', nargs='*', type=int, help='Only export these quizzes (default: all)')
+        parser.add_argument(
+            '--output', '-o', default='-',
+            help='File to write (.jsonl, .csv, optionally .gz; default: stdout)'
+        )
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file extension, else jsonl)')
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of questions read per query (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format'] or detect_format(output) or 'jsonl'
+        questions = Question.objects.all()
+        if options['quiz_ids']:
+            questions = questions.filter(quiz_id__in=options['quiz_ids'])
+
+        lines = export_lines(questions, fmt, chunk_size=options['chunk_size'])
+        if output == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        exported = 0
+        try:
+            with open_text(output, 'w') as stream:
+                for line in lines:
+                    stream.write(line)
+                    exported += 1
+        except OSError as exc:
+            raise CommandError(exc)
+        if fmt == 'csv':
+            exported -= 1
+        self.stdout.write(self.style.SUCCESS(f'Exported {exported} questions to {output}'))
@@ -0,0 +1,220 @@
+import math
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from quiz.caching import bump_public_version
+from quiz.layouts import layout_question_ids
+from quiz.leaderboard import touch_leaderboards
+from quiz.models import Category, Choice, Question, Quiz, QuizAttempt, UserAnswer
+from quiz.question_bank import refresh_quiz_content
+
+
+CHOICES_PER_QUESTION = 4
+HISTORY_DAYS = 90
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-create synthetic users, quizzes, questions and completed attempts for load testing. '
+        'Scores follow a simple item response model: each user has an ability and each question a difficulty.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users (default: 1000)')
+        parser.add_argument('--quizzes', type=int, default=20, help='Number of quizzes (default: 20)')
+        parser.add_argument('--questions', type=int, default=100, help='Questions per quiz (default: 100)')
+        parser.add_argument('--attempts', type=int, default=10000, help='Completed attempts (default: 10000)')
+        parser.add_argument(
+            '--questions-per-attempt', type=int, default=10,
+            help='Questions shown per attempt, the quizzes\' questions_count (default: 10)'
+        )
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk insert (default: 2000)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--prefix', default='load', help='Prefix for generated usernames and titles (default: load)')
+        parser.add_argument('--password', default='loadtest123', help='Password of the generated users')
+
+    def handle(self, *args, **options):
+        for name in ('users', 'quizzes', 'questions', 'questions_per_attempt', 'batch_size'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be at least 1')
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError('generate_load_data needs a database that returns ids from bulk inserts')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        started = time.monotonic()
+
+        users = self.create_users(options['users'], options['password'])
+        quizzes = self.create_quizzes(options['quizzes'], options['questions_per_attempt'], users)
+        questions = self.create_questions(quizzes, options['questions'])
+        attempts = self.create_attempts(options['attempts'], users, quizzes, questions)
+
+        # Attempts were written in bulk, without record_completed_attempt;
+        # the rebuild also drops the cached quiz rankings
+        call_command('rebuild_score_summaries', stdout=self.stdout)
+        quiz_ids = [quiz.id for quiz in quizzes]
+        for quiz_id in quiz_ids:
+            touch_leaderboards(quiz_id)
+        bump_public_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} users, {len(quizzes)} quizzes, {sum(map(len, questions.values()))} questions '
+            f'and {attempts} attempts in {time.monotonic() - started:.1f}s'
+        ))
+
+    def create_users(self, count, password):
+        # Hashing is slow on purpose, every user shares one hash
+        password = make_password(password)
+        offset = User.objects.filter(username__startswith=f'{self.prefix}_user_').count()
+        users = User.objects.bulk_create(
+            [
+                User(username=f'{self.prefix}_user_{offset + number}', password=password)
+                for number in range(1, count + 1)
+            ],
+            batch_size=self.batch_size,
+        )
+        for user in users:
+            # Activity is heavy tailed: a few users take most of the attempts
+            user.activity = self.rng.paretovariate(1.5)
+            user.ability = self.rng.gauss(0, 1)
+        self.stdout.write(f'Created {len(users)} users...')
+        return users
+
+    def create_quizzes(self, count, questions_count, users):
+        categories = [
+            Category.objects.get_or_create(name=f'{self.prefix.title()} category {number}')[0]
+            for number in range(1, 6)
+        ]
+        owner = User.objects.filter(is_superuser=True).first() or users[0]
+        quizzes = Quiz.objects.bulk_create([
+            Quiz(
+                title=f'{self.prefix.title()} quiz {number}',
+                description='Generated for load testing',
+                category=self.rng.choice(categories),
+                difficulty=self.rng.choice(['easy', 'medium', 'hard']),
+                questions_count=questions_count,
+                created_by=owner,
+            )
+            for number in range(1, count + 1)
+        ], batch_size=self.batch_size)
+        for quiz in quizzes:
+            quiz.popularity = self.rng.paretovariate(1.2)
+        self.stdout.write(f'Created {len(quizzes)} quizzes...')
+        return quizzes
+
+    def create_questions(self, quizzes, per_quiz):
+        """
+        Create the questions and choices. Returns ``{quiz_id: {question_id:
+        (points, difficulty, correct_choice_id, wrong_choice_ids)}}``.
+        """
+        bank = {}
+        with transaction.atomic():
+            for quiz in quizzes:
+                questions = Question.objects.bulk_create([
+                    Question(
+                        quiz=quiz,
+                        question_text=f'{quiz.title}, question {number}',
+                        points=self.rng.choice([1, 1, 1, 2, 2, 3]),
+                        time_limit=self.rng.choice([30, 45, 60, 90]),
+                    )
+                    for number in range(1, per_quiz + 1)
+                ], batch_size=self.batch_size)
+                choices = Choice.objects.bulk_create([
+                    Choice(question=question, choice_text=f'Choice {number}', is_correct=number == 1)
+                    for question in questions
+                    for number in range(1, CHOICES_PER_QUESTION + 1)
+                ], batch_size=self.batch_size)
+                by_question = {}
+                for choice in choices:
+                    by_question.setdefault(choice.question_id, []).append(choice.id)
+                bank[quiz.id] = {
+                    question.id: (
+                        question.points, self.rng.gauss(0, 1), by_question[question.id][0], by_question[question.id][1:],
+                    )
+                    for question in questions
+                }
+            refresh_quiz_content([quiz.id for quiz in quizzes])
+        versions = dict(Quiz.objects.filter(pk__in=bank).values_list('pk', 'content_version'))
+        for quiz in quizzes:
+            quiz.content_version = versions[quiz.pk]
+        self.stdout.write(f'Created {sum(map(len, bank.values()))} questions...')
+        return bank
+
+    def create_attempts(self, count, users, quizzes, bank):
+        user_weights = [user.activity for user in users]
+        quiz_weights = [quiz.popularity for quiz in quizzes]
+        now = timezone.now()
+        created = 0
+        while created < count:
+            size = min(self.batch_size, count - created)
+            attempts = []
+            answers = []
+            for user, quiz in zip(
+                self.rng.choices(users, user_weights, k=size), self.rng.choices(quizzes, quiz_weights, k=size)
+            ):
+                attempt, attempt_answers = self.build_attempt(user, quiz, bank[quiz.id], now)
+                attempts.append(attempt)
+                answers.append(attempt_answers)
+
+            with transaction.atomic():
+                QuizAttempt.objects.bulk_create(attempts)
+                # completed_at is auto_now_add, which bulk_create overwrites
+                for attempt in attempts:
+                    attempt.completed_at = attempt.finished_at
+                QuizAttempt.objects.bulk_update(attempts, ['completed_at'], batch_size=500)
+                for attempt, attempt_answers in zip(attempts, answers):
+                    for answer in attempt_answers:
+                        answer.attempt = attempt
+                UserAnswer.objects.bulk_create(
+                    [answer for attempt_answers in answers for answer in attempt_answers],
+                    batch_size=self.batch_size,
+                )
+            created += size
+            self.stdout.write(f'Created {created} attempts...')
+        return created
+
+    def build_attempt(self, user, quiz, questions, now):
+        seed = self.rng.getrandbits(62)
+        question_ids = layout_question_ids(quiz, seed, quiz.questions_count)
+        answers = []
+        score = 0
+        max_score = 0
+        for question_id in question_ids:
+            points, difficulty, correct_choice_id, wrong_choice_ids = questions[question_id]
+            # Rasch model: the chance of a right answer grows with ability - difficulty
+            is_correct = self.rng.random() < 1 / (1 + math.exp(difficulty - user.ability))
+            max_score += points
+            score += points if is_correct else 0
+            answers.append(UserAnswer(
+                question_id=question_id,
+                selected_choice_id=correct_choice_id if is_correct else self.rng.choice(wrong_choice_ids),
+                is_correct=is_correct,
+                time_taken=min(int(self.rng.lognormvariate(math.log(15), 0.6)) + 1, 120),
+            ))
+
+        time_taken = timedelta(seconds=sum(answer.time_taken for answer in answers) + self.rng.randint(2, 20))
+        finished_at = now - timedelta(seconds=self.rng.uniform(0, HISTORY_DAYS * 24 * 60 * 60))
+        attempt = QuizAttempt(
+            user=user,
+            quiz=quiz,
+            score=score,
+            max_score=max_score,
+            total_questions=len(question_ids),
+            answered_count=len(answers),
+            seed=seed,
+            content_version=quiz.content_version,
+            time_taken=time_taken,
+            started_at=finished_at - time_taken,
+            is_completed=True,
+        )
+        attempt.finished_at = finished_at
+        return attempt, answers
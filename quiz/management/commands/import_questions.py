@@ -0,0 +1,80 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.question_bank import (
+    FORMATS, InvalidRecord, clean_record, detect_format, existing_quiz_ids, import_batch, read_records,
+)
+from quiz.streaming import open_text
+
+
+class Command(BaseCommand):
+    help = 'Import questions and choices from a JSON Lines or CSV question bank (see quiz/question_bank.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import (.jsonl, .csv, optionally .gz; - for stdin)')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file extension)')
+        parser.add_argument('--quiz', type=int, help='Quiz for rows without a quiz_id')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of questions written per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--max-errors', type=int, default=100,
+            help='Stop after this many invalid rows (default: 100)'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        if fmt is None:
+            raise CommandError('Cannot tell the format from the file name, pass --format')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['quiz'] is not None and not existing_quiz_ids([options['quiz']]):
+            raise CommandError(f'Quiz {options["quiz"]} does not exist')
+
+        totals = {'created': 0, 'updated': 0, 'unchanged': 0}
+        errors = 0
+        rows = 0
+        known_quizzes = set()
+        batch = []
+        started = time.monotonic()
+
+        def flush():
+            for key, value in import_batch(batch).items():
+                totals[key] += value
+            batch.clear()
+            elapsed = max(time.monotonic() - started, 0.001)
+            self.stdout.write(f'Imported {rows} rows ({rows / elapsed:.0f} rows/s)...')
+
+        try:
+            with open_text(path) as stream:
+                for line_number, record in read_records(stream, fmt):
+                    rows += 1
+                    try:
+                        record = clean_record(record, options['quiz'])
+                        if record['quiz_id'] not in known_quizzes:
+                            if not existing_quiz_ids([record['quiz_id']]):
+                                raise InvalidRecord(f'quiz {record["quiz_id"]} does not exist')
+                            known_quizzes.add(record['quiz_id'])
+                    except InvalidRecord as exc:
+                        errors += 1
+                        self.stderr.write(f'Line {line_number}: {exc}')
+                        if errors >= options['max_errors']:
+                            raise CommandError(f'Stopped after {errors} invalid rows')
+                        continue
+                    batch.append(record)
+                    if len(batch) >= options['batch_size']:
+                        flush()
+                if batch:
+                    flush()
+        except OSError as exc:
+            raise CommandError(exc)
+
+        elapsed = max(time.monotonic() - started, 0.001)
+        self.stdout.write(self.style.SUCCESS(
+            f'{rows} rows in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s): '
+            f'{totals["created"]} created, {totals["updated"]} updated, '
+            f'{totals["unchanged"]} unchanged, {errors} invalid'
+        ))
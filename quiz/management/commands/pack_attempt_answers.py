@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.models import QuizAttempt
+from quiz.packed_answers import pack_attempts, unpack_attempts
+
+
+class Command(BaseCommand):
+    help = (
+        'Move the answers of completed attempts from UserAnswer rows into QuizAttempt.packed_answers, '
+        'or back with --unpack (see quiz/packed_answers.py)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of attempts converted per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--unpack', action='store_true',
+            help='Restore UserAnswer rows from packed attempts instead'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the attempts that would be converted'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['unpack']:
+            attempts = QuizAttempt.objects.filter(packed_answers__isnull=False)
+            convert = unpack_attempts
+            verb = 'Unpacked'
+        else:
+            attempts = QuizAttempt.objects.filter(is_completed=True, packed_answers__isnull=True)
+            convert = pack_attempts
+            verb = 'Packed'
+
+        if options['dry_run']:
+            self.stdout.write(f'{attempts.count()} attempts to convert')
+            return
+
+        attempt_ids = attempts.order_by('id').values_list('id', flat=True)
+        converted = 0
+        answers = 0
+        last_id = 0
+        while True:
+            chunk = list(attempt_ids.filter(id__gt=last_id)[:options['batch_size']])
+            if not chunk:
+                break
+            last_id = chunk[-1]
+            chunk_attempts, chunk_answers = convert(chunk)
+            converted += chunk_attempts
+            answers += chunk_answers
+            self.stdout.write(f'{verb} {converted} attempts...')
+
+        self.stdout.write(self.style.SUCCESS(f'{verb} {answers} answers of {converted} attempts'))
@@ -0,0 +1,107 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, Case, Count, F, FloatField, Max, Sum, Value, When
+from django.db.models.functions import Round, TruncDate
+
+from quiz.leaderboard import invalidate_quiz_rankings
+from quiz.models import Quiz, QuizAttempt, ScoreRollup, UserCategorySummary, UserScoreSummary
+
+
+# Same value as QuizAttempt.get_percentage(), computed in the database
+PERCENTAGE = Case(
+    When(max_score__gt=0, then=Round(F('score') * 100.0 / F('max_score'), 2)),
+    When(total_questions__gt=0, then=Round(F('score') * 100.0 / F('total_questions'), 2)),
+    default=Value(0.0),
+    output_field=FloatField(),
+)
+
+SUMMARY_FIELDS = ['total_score', 'total_attempts', 'avg_score', 'best_percentage', 'percentage_sum']
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the leaderboard and summary tables (UserScoreSummary, UserCategorySummary and ScoreRollup) '
+        'from completed attempts, one chunk of users per transaction; safe to run while attempts are completed'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of users aggregated and committed at a time (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        completed = QuizAttempt.objects.filter(is_completed=True)
+        user_ids = completed.order_by('user_id').values_list('user_id', flat=True).distinct()
+
+        rebuilt = 0
+        last_user_id = 0
+        while True:
+            chunk = list(user_ids.filter(user_id__gt=last_user_id)[:chunk_size])
+            if not chunk:
+                break
+            last_user_id = chunk[-1]
+            self.rebuild_chunk(chunk)
+            rebuilt += len(chunk)
+            self.stdout.write(f'Rebuilt {rebuilt} users...')
+
+        # Users whose completed attempts are all gone
+        with transaction.atomic():
+            UserScoreSummary.objects.exclude(user_id__in=completed.values('user_id')).delete()
+            UserCategorySummary.objects.exclude(user_id__in=completed.values('user_id')).delete()
+            ScoreRollup.objects.exclude(user_id__in=completed.values('user_id')).delete()
+
+        # Cached quiz rankings are rebuilt from the attempts on their next read
+        invalidate_quiz_rankings(Quiz.objects.order_by('id').values_list('id', flat=True).iterator())
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt score summaries for {rebuilt} users'))
+
+    def rebuild_chunk(self, chunk):
+        """
+        Recompute the summaries of some users. record_completed_attempt adds
+        to the user's UserScoreSummary row before anything else, so while
+        this transaction holds those rows a completion of the same user
+        waits, and is added on top of the rebuilt figures once it commits.
+        Completions committed before the rows were locked are in the
+        aggregates below. The summary rows are updated in place rather than
+        deleted, so a waiting increment still finds its row.
+        """
+        with transaction.atomic():
+            UserScoreSummary.objects.bulk_create(
+                [UserScoreSummary(user_id=user_id) for user_id in chunk], ignore_conflicts=True
+            )
+            summaries = UserScoreSummary.objects.select_for_update().filter(
+                user_id__in=chunk
+            ).order_by('user_id').in_bulk(field_name='user_id')
+            attempts = QuizAttempt.objects.filter(is_completed=True, user_id__in=chunk)
+
+            totals = attempts.values('user_id').annotate(
+                total_score=Sum('score'),
+                total_attempts=Count('id'),
+                avg_score=Avg('score'),
+                best_percentage=Max(PERCENTAGE),
+                percentage_sum=Sum(PERCENTAGE),
+            ).order_by()
+            for row in totals:
+                summary = summaries[row.pop('user_id')]
+                for field, value in row.items():
+                    setattr(summary, field, value)
+            UserScoreSummary.objects.bulk_update(summaries.values(), SUMMARY_FIELDS)
+
+            categories = attempts.values('user_id', category_id=F('quiz__category_id')).annotate(
+                total_attempts=Count('id'),
+                best_percentage=Max(PERCENTAGE),
+                percentage_sum=Sum(PERCENTAGE),
+            ).order_by()
+            UserCategorySummary.objects.filter(user_id__in=chunk).delete()
+            UserCategorySummary.objects.bulk_create([UserCategorySummary(**row) for row in categories])
+
+            # TruncDate uses the current time zone (settings.TIME_ZONE)
+            rollups = attempts.annotate(day=TruncDate('completed_at')).values('user_id', 'quiz_id', 'day').annotate(
+                total_score=Sum('score'),
+                best_score=Max('score'),
+                attempts=Count('id'),
+            ).order_by()
+            ScoreRollup.objects.filter(user_id__in=chunk).delete()
+            ScoreRollup.objects.bulk_create([ScoreRollup(**row) for row in rollups])
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from quiz.counters import recompute_question_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized question counters on every quiz'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_ids', nargs='*', type=int, help='Only repair these quizzes')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of quizzes updated per query (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        updated = recompute_question_counters(options['quiz_ids'] or None, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Repaired question counters for {updated} quizzes'))
@@ -0,0 +1,51 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from quiz.item_analysis import reset_question_stats, update_chunk
+
+
+class Command(BaseCommand):
+    help = (
+        'Update the per-question item analysis (p-value, discrimination, answer times and choice '
+        'selection rates) with the attempts completed since the last run, see quiz/item_analysis.py'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Number of attempts read and counted per transaction (default: 2000)'
+        )
+        parser.add_argument(
+            '--settle', type=float, default=60,
+            help='Leave attempts completed in the last this many seconds for the next run (default: 60)'
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Start over from all completed attempts, e.g. after attempts were deleted'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        # A completion still being committed gets a completed_at slightly in
+        # the past, stopping short of now keeps it ahead of the watermark
+        until = timezone.now() - timedelta(seconds=options['settle'])
+        if options['rebuild']:
+            reset_question_stats()
+
+        attempts = 0
+        answers = 0
+        started = time.monotonic()
+        while True:
+            chunk_attempts, chunk_answers = update_chunk(until, options['chunk_size'])
+            if not chunk_attempts:
+                break
+            attempts += chunk_attempts
+            answers += chunk_answers
+            elapsed = max(time.monotonic() - started, 0.001)
+            self.stdout.write(f'Counted {attempts} attempts, {answers} answers ({answers / elapsed:.0f} answers/s)...')
+
+        self.stdout.write(self.style.SUCCESS(f'Added {attempts} attempts and {answers} answers to the question stats'))
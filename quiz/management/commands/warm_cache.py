@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from quiz.attempt_state import cache_is_shared
+from quiz.bundles import get_quiz_bundle
+from quiz.models import Quiz
+from quiz.sampling import get_question_pool
+
+
+def default_host():
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+class Command(BaseCommand):
+    help = 'Warm the cache after a deploy: public pages, question pools and quiz bundles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host', default=default_host(),
+            help='Host header used for the page requests (default: first entry of ALLOWED_HOSTS)'
+        )
+        parser.add_argument(
+            '--quizzes', type=int, default=50,
+            help='Warm the pages of this many most recent quizzes (default: 50)'
+        )
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            # This command runs in its own process, so a per-process cache
+            # would be thrown away when it exits
+            raise CommandError(
+                'The default cache is per process (locmem or dummy), so there is nothing to warm; '
+                "use 'file', 'db' or 'redis'"
+            )
+        quiz_ids = list(
+            Quiz.objects.filter(is_active=True).order_by('-created_at').values_list('id', flat=True)[:options['quizzes']]
+        )
+        for quiz_id in quiz_ids:
+            get_question_pool(quiz_id)
+            get_quiz_bundle(quiz_id)
+
+        paths = [reverse('quiz:home'), reverse('quiz:quiz_list'), reverse('quiz:leaderboard')]
+        for quiz_id in quiz_ids:
+            paths.append(reverse('quiz:quiz_detail', args=[quiz_id]))
+            paths.append(reverse('quiz:quiz_leaderboard', args=[quiz_id]))
+
+        # Anonymous requests go through the same page cache as real visitors
+        client = Client(HTTP_HOST=options['host'], raise_request_exception=False)
+        secure = getattr(settings, 'SECURE_SSL_REDIRECT', False)
+        failed = 0
+        for path in paths:
+            response = client.get(path, secure=secure)
+            if response.status_code != 200:
+                failed += 1
+                self.stderr.write(f'{path}: HTTP {response.status_code}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Warmed {len(quiz_ids)} quizzes and {len(paths) - failed} of {len(paths)} pages'
+        ))
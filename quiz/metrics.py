@@ -0,0 +1,226 @@
+"""
+Per-request instrumentation and a Prometheus metrics endpoint.
+
+``RequestMetricsMiddleware`` measures every request: wall time, number and
+total time of SQL queries (through ``connection.execute_wrapper``) and time
+spent rendering templates (through the ``TimedDjangoTemplates`` template
+backend). The numbers are folded into in-memory histograms keyed by URL
+name, so a request costs a few clock reads and one short lock, and
+``metrics`` serves them in the Prometheus text format.
+
+Requests slower than ``SLOW_REQUEST_THRESHOLD`` seconds are logged to the
+``quiz.metrics`` logger with their slowest queries.
+
+Histograms live in the memory of each worker process. Scrape every worker
+(or run a single one per host) and sum in Prometheus.
+"""
+
+import bisect
+import contextvars
+import logging
+import hmac
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger('quiz.metrics')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+UNRESOLVED = '<unresolved>'
+# Any other method is counted as OTHER_METHOD, clients can send arbitrary ones
+HTTP_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'CONNECT', 'TRACE'})
+OTHER_METHOD = 'other'
+
+_current = contextvars.ContextVar('quiz_request_metrics', default=None)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+# name: (help, buckets, label names)
+METRICS = {
+    'quiz_http_request_duration_seconds': (
+        'Wall time of HTTP requests', DURATION_BUCKETS, ('view', 'method', 'status'),
+    ),
+    'quiz_http_request_sql_queries': (
+        'SQL queries run per request', QUERY_COUNT_BUCKETS, ('view',),
+    ),
+    'quiz_http_request_sql_seconds': (
+        'Time spent in SQL queries per request', DURATION_BUCKETS, ('view',),
+    ),
+    'quiz_http_request_template_seconds': (
+        'Time spent rendering templates per request', DURATION_BUCKETS, ('view',),
+    ),
+}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {name: {} for name in METRICS}
+
+    def _histogram(self, name, labels):
+        histograms = self.histograms[name]
+        histogram = histograms.get(labels)
+        if histogram is None:
+            histogram = histograms[labels] = Histogram(METRICS[name][1])
+        return histogram
+
+    def record(self, view, method, status, stats):
+        with self.lock:
+            self._histogram('quiz_http_request_duration_seconds', (view, method, str(status))).observe(stats.duration)
+            self._histogram('quiz_http_request_sql_queries', (view,)).observe(stats.query_count)
+            self._histogram('quiz_http_request_sql_seconds', (view,)).observe(stats.query_time)
+            self._histogram('quiz_http_request_template_seconds', (view,)).observe(stats.template_time)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (help_text, _, label_names) in METRICS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    label_text = ','.join(
+                        f'{label}="{_escape(value)}"' for label, value in zip(label_names, labels)
+                    )
+                    lines.extend(histogram.lines(name, label_text))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {name: {} for name in METRICS}
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+class RequestStats:
+    __slots__ = ('duration', 'query_count', 'query_time', 'template_time', 'slowest')
+
+    def __init__(self):
+        self.duration = 0.0
+        self.query_count = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+        # (seconds, sql) of the slowest queries, fastest first
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook, runs around every query
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.query_count += 1
+            self.query_time += elapsed
+            if len(self.slowest) < settings.SLOW_REQUEST_QUERIES:
+                bisect.insort(self.slowest, (elapsed, sql))
+            elif self.slowest and elapsed > self.slowest[0][0]:
+                self.slowest[0] = (elapsed, sql)
+                self.slowest.sort()
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each render for the metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            stats.duration = time.perf_counter() - start
+            _current.reset(token)
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else UNRESOLVED
+        method = request.method if request.method in HTTP_METHODS else OTHER_METHOD
+        registry.record(view, method, response.status_code, stats)
+        if stats.duration >= settings.SLOW_REQUEST_THRESHOLD:
+            log_slow_request(request, response, view, stats)
+        return response
+
+
+def log_slow_request(request, response, view, stats):
+    queries = ''.join(
+        f'\n  {seconds * 1000:.1f} ms  {sql[:500]}' for seconds, sql in reversed(stats.slowest)
+    )
+    logger.warning(
+        'Slow request: %s %s (%s) %s in %.0f ms, %d queries in %.0f ms, templates %.0f ms%s',
+        request.method, request.path, view, response.status_code, stats.duration * 1000,
+        stats.query_count, stats.query_time * 1000, stats.template_time * 1000, queries,
+    )
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, for METRICS_TOKEN holders and METRICS_ALLOWED_IPS."""
+    token = settings.METRICS_TOKEN
+    authorized = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized and request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,7 +1,8 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
-from django.utils import timezone
-import random
+
+from .sampling import sample_question_ids
 
 
 class Category(models.Model):
@@ -29,21 +30,50 @@ class Quiz(models.Model):
     difficulty = models.CharField(max_length=10, choices=DIFFICULTY_CHOICES, default='medium')
     time_limit = models.IntegerField(help_text="Time limit in minutes", default=30)
     questions_count = models.IntegerField(help_text="Number of questions to show", default=10)
+    stratify_by_points = models.BooleanField(
+        default=False,
+        help_text="Keep each points level's share of the question bank when picking questions"
+    )
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Maintained from Question signals, see quiz/counters.py
+    active_question_count = models.IntegerField(default=0, editable=False)
+    total_points = models.IntegerField(default=0, editable=False)
+    # Bumped whenever questions or choices change, see quiz/layouts.py
+    content_version = models.IntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('active_question_count', 'total_points')
+    MAINTAINED_FIELDS = COUNTER_FIELDS + ('content_version',)
 
     class Meta:
         verbose_name_plural = "Quizzes"
+        indexes = [
+            models.Index(fields=['is_active', '-created_at', '-id'], name='quiz_catalogue_idx'),
+            models.Index(fields=['category', 'is_active', '-created_at', '-id'], name='quiz_category_catalogue_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # The counters and content version are updated in place with F()
+        # expressions, never write back a possibly stale copy when saving an
+        # existing quiz
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    def get_random_question_ids(self):
+        return sample_question_ids(self.id, self.questions_count, stratified=self.stratify_by_points)
+
     def get_random_questions(self):
-        questions = list(self.questions.filter(is_active=True))
-        if len(questions) <= self.questions_count:
-            return questions
-        return random.sample(questions, self.questions_count)
+        question_ids = self.get_random_question_ids()
+        questions = self.questions.in_bulk(question_ids)
+        return [questions[question_id] for question_id in question_ids if question_id in questions]
 
 
 class Question(models.Model):
@@ -59,10 +89,34 @@ class Question(models.Model):
     time_limit = models.IntegerField(help_text="Time limit in seconds", default=60)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    external_key = models.CharField(
+        max_length=100, null=True, blank=True,
+        help_text="Identifies the question in imported question banks"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['quiz', 'external_key'], name='unique_question_external_key'),
+        ]
 
     def __str__(self):
         return f"{self.quiz.title} - {self.question_text[:50]}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what this question contributes to its quiz's counters,
+        # and its quiz, so a move to another quiz updates the old one too
+        if {'quiz_id', 'is_active', 'points'}.issubset(field_names):
+            instance._counted_state = instance.counter_state()
+        if 'quiz_id' in field_names:
+            instance._loaded_quiz_id = instance.quiz_id
+        return instance
+
+    def counter_state(self):
+        """``(quiz_id, points)`` if the question counts towards its quiz, else None."""
+        return (self.quiz_id, self.points) if self.is_active else None
+
     def get_correct_answer(self):
         return self.choices.filter(is_correct=True).first()
 
@@ -79,23 +133,45 @@ class Choice(models.Model):
 class QuizAttempt(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
-    score = models.IntegerField(default=0)
+    score = models.IntegerField(default=0, help_text="Points earned so far, kept up to date as answers arrive")
+    max_score = models.IntegerField(default=0, help_text="Total points of the questions in this attempt")
     total_questions = models.IntegerField()
+    answered_count = models.IntegerField(default=0)
+    seed = models.BigIntegerField(default=0, help_text="Seed the question and choice order are generated from")
+    content_version = models.IntegerField(default=0, help_text="Quiz content version the layout was drawn from")
     time_taken = models.DurationField()
     started_at = models.DateTimeField()
     completed_at = models.DateTimeField(auto_now_add=True)
     is_completed = models.BooleanField(default=False)
+    # Answers of a completed attempt packed into one value instead of
+    # UserAnswer rows, see quiz/packed_answers.py
+    packed_answers = models.BinaryField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['-completed_at']
+        indexes = [
+            models.Index(fields=['quiz', 'is_completed', '-score', 'time_taken'], name='attempt_quiz_rank_idx'),
+            models.Index(fields=['user', 'is_completed', '-completed_at', '-id'], name='attempt_user_history_idx'),
+            models.Index(fields=['started_at'], condition=Q(is_completed=False), name='attempt_open_started_idx'),
+            models.Index(fields=['completed_at', 'id'], condition=Q(is_completed=True), name='attempt_completed_idx'),
+        ]
+        constraints = [
+            # Older databases can hold several open attempts per user and
+            # quiz; run dedupe_open_attempts before migrating to this
+            models.UniqueConstraint(
+                fields=['user', 'quiz'], condition=Q(is_completed=False), name='one_open_attempt_per_quiz'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.quiz.title} - {self.score}/{self.total_questions}"
 
     def get_percentage(self):
-        if self.total_questions == 0:
+        # Attempts from before points-weighted scoring have no max_score
+        possible = self.max_score or self.total_questions
+        if possible == 0:
             return 0
-        return round((self.score / self.total_questions) * 100, 2)
+        return round((self.score / possible) * 100, 2)
 
 
 class UserAnswer(models.Model):
@@ -105,5 +181,129 @@ class UserAnswer(models.Model):
     is_correct = models.BooleanField(default=False)
     time_taken = models.IntegerField(help_text="Time taken in seconds")
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['attempt', 'question'], name='unique_answer_per_question'),
+        ]
+
     def __str__(self):
         return f"{self.attempt.user.username} - {self.question.question_text[:30]}"
+
+
+class UserScoreSummary(models.Model):
+    """Per-user totals over completed attempts, kept up to date for the leaderboard."""
+    user = models.OneToOneField(User, related_name='score_summary', on_delete=models.CASCADE)
+    total_score = models.IntegerField(default=0)
+    total_attempts = models.IntegerField(default=0)
+    avg_score = models.FloatField(default=0)
+    best_percentage = models.FloatField(default=0)
+    percentage_sum = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "User score summaries"
+        indexes = [
+            models.Index(fields=['-total_score'], name='summary_total_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.total_score}"
+
+    def get_avg_percentage(self):
+        if self.total_attempts == 0:
+            return 0
+        return round(self.percentage_sum / self.total_attempts, 2)
+
+
+class UserCategorySummary(models.Model):
+    """Per-user, per-category totals over completed attempts, for My Results."""
+    user = models.ForeignKey(User, related_name='category_summaries', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    total_attempts = models.IntegerField(default=0)
+    best_percentage = models.FloatField(default=0)
+    percentage_sum = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name_plural = "User category summaries"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'], name='unique_category_summary'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.category.name}"
+
+    def get_avg_percentage(self):
+        if self.total_attempts == 0:
+            return 0
+        return round(self.percentage_sum / self.total_attempts, 2)
+
+
+class ScoreRollup(models.Model):
+    """
+    Completed attempts of a user on a quiz, bucketed by local day
+    (settings.TIME_ZONE). Weekly and monthly leaderboards merge these buckets.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
+    day = models.DateField()
+    total_score = models.IntegerField(default=0)
+    best_score = models.IntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['quiz', 'day', 'user'], name='unique_rollup_per_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'user'], name='rollup_day_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.quiz.title} - {self.day}"
+
+
+class QuestionStats(models.Model):
+    """
+    Item analysis of a question over the answers of completed attempts,
+    maintained by the update_question_stats command (quiz/item_analysis.py).
+    The running sums are kept so later runs can add newer answers without
+    reading the old ones again.
+    """
+    question = models.OneToOneField(Question, related_name='stats', on_delete=models.CASCADE)
+    answer_count = models.IntegerField(default=0)
+    correct_count = models.IntegerField(default=0)
+    # Answers in attempts with other questions, which the discrimination is computed over
+    paired_count = models.IntegerField(default=0)
+    paired_correct_count = models.IntegerField(default=0)
+    rest_score_sum = models.FloatField(default=0)
+    rest_score_square_sum = models.FloatField(default=0)
+    correct_rest_score_sum = models.FloatField(default=0)
+    time_sum = models.BigIntegerField(default=0)
+    # {seconds: answers} and {choice id: answers}
+    time_histogram = models.JSONField(default=dict)
+    choice_counts = models.JSONField(default=dict)
+
+    p_value = models.FloatField(null=True, help_text="Fraction of answers that were correct")
+    discrimination = models.FloatField(
+        null=True, help_text="Point-biserial correlation between a right answer and the rest of the attempt's score"
+    )
+    time_mean = models.FloatField(null=True)
+    time_median = models.FloatField(null=True)
+    time_p90 = models.FloatField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Question stats"
+
+    def __str__(self):
+        return f"{self.question} - {self.answer_count} answers"
+
+
+class QuestionStatsWatermark(models.Model):
+    """The last completed attempt, by (completed_at, id), counted in QuestionStats."""
+    completed_at = models.DateTimeField(null=True)
+    attempt_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.completed_at} - {self.attempt_id}"
@@ -0,0 +1,164 @@
+"""
+Compact storage of a completed attempt's answers.
+
+With ``PACK_COMPLETED_ANSWERS`` on, finishing an attempt moves its
+UserAnswer rows into one ``QuizAttempt.packed_answers`` value and deletes
+the rows; the pack_attempt_answers command converts (or restores) existing
+attempts in batches. Open attempts always keep their rows, answers are
+still being written and replaced while the quiz runs.
+
+Layout, little-endian::
+
+    1 byte        id width: 1 for 32-bit ids, 2 for 64-bit ids
+    2 bytes       number of answers, n
+    n ids         question ids
+    n ids         chosen choice ids, 0 for none
+    n x 2 bytes   seconds taken, capped at 65535
+    (n + 7) // 8  correctness bits, answer i is bit i % 8 of byte i // 8
+
+Ten answers take 105 bytes in the attempt row instead of ten rows and their
+index entries.
+"""
+
+import struct
+from collections import namedtuple
+
+from django.db import transaction
+
+from .models import Choice, Question, QuizAttempt, UserAnswer
+
+
+PackedAnswer = namedtuple('PackedAnswer', ['question_id', 'choice_id', 'is_correct', 'time_taken'])
+
+HEADER = struct.Struct('<BH')
+ID_FORMATS = {1: 'I', 2: 'Q'}
+MAX_ANSWERS = 0xFFFF
+MAX_SECONDS = 0xFFFF
+ANSWER_FIELDS = ('attempt_id', 'question_id', 'selected_choice_id', 'is_correct', 'time_taken')
+
+
+def _body_format(width, count):
+    id_format = ID_FORMATS[width]
+    return f'<{count}{id_format}{count}{id_format}{count}H{(count + 7) // 8}s'
+
+
+def pack_answers(answers):
+    """Encode ``(question_id, choice_id, is_correct, time_taken)`` tuples."""
+    answers = list(answers)
+    count = len(answers)
+    if count > MAX_ANSWERS:
+        raise ValueError(f'cannot pack more than {MAX_ANSWERS} answers')
+    question_ids = [question_id for question_id, _, _, _ in answers]
+    choice_ids = [choice_id or 0 for _, choice_id, _, _ in answers]
+    width = 1 if max(question_ids + choice_ids, default=0) <= 0xFFFFFFFF else 2
+    bits = bytearray((count + 7) // 8)
+    for index, (_, _, is_correct, _) in enumerate(answers):
+        if is_correct:
+            bits[index >> 3] |= 1 << (index & 7)
+    seconds = [min(max(time_taken or 0, 0), MAX_SECONDS) for _, _, _, time_taken in answers]
+    return HEADER.pack(width, count) + struct.pack(
+        _body_format(width, count), *question_ids, *choice_ids, *seconds, bytes(bits)
+    )
+
+
+def unpack_answers(data):
+    """Decode packed answers into a list of PackedAnswer."""
+    data = bytes(data)
+    width, count = HEADER.unpack_from(data)
+    values = struct.unpack_from(_body_format(width, count), data, HEADER.size)
+    question_ids = values[:count]
+    choice_ids = values[count:2 * count]
+    seconds = values[2 * count:3 * count]
+    bits = values[-1]
+    return [
+        PackedAnswer(
+            question_ids[index], choice_ids[index] or None, bool(bits[index >> 3] >> (index & 7) & 1), seconds[index],
+        )
+        for index in range(count)
+    ]
+
+
+def pack_attempts(attempt_ids):
+    """
+    Move the UserAnswer rows of completed attempts into their packed_answers.
+    Attempts that are open or already packed are left alone. Returns
+    ``(attempts, answers)`` packed.
+    """
+    with transaction.atomic():
+        attempts = list(QuizAttempt.objects.select_for_update().filter(
+            id__in=attempt_ids, is_completed=True, packed_answers__isnull=True,
+        ).only('id'))
+        if not attempts:
+            return 0, 0
+        answers = {}
+        for attempt_id, *answer in UserAnswer.objects.filter(
+            attempt__in=attempts
+        ).order_by('id').values_list(*ANSWER_FIELDS):
+            answers.setdefault(attempt_id, []).append(answer)
+        for attempt in attempts:
+            attempt.packed_answers = pack_answers(answers.get(attempt.id, []))
+        QuizAttempt.objects.bulk_update(attempts, ['packed_answers'])
+        UserAnswer.objects.filter(attempt__in=attempts).delete()
+    return len(attempts), sum(map(len, answers.values()))
+
+
+def unpack_attempts(attempt_ids):
+    """
+    Turn packed answers back into UserAnswer rows. Answers to questions or
+    choices deleted since are dropped. Returns ``(attempts, answers)``
+    restored.
+    """
+    with transaction.atomic():
+        attempts = list(QuizAttempt.objects.select_for_update().filter(
+            id__in=attempt_ids, packed_answers__isnull=False,
+        ).only('id', 'packed_answers'))
+        decoded = [(attempt, unpack_answers(attempt.packed_answers)) for attempt in attempts]
+        question_ids, choice_ids = _existing_ids(answer for _, answers in decoded for answer in answers)
+        rows = [
+            UserAnswer(
+                attempt=attempt,
+                question_id=answer.question_id,
+                selected_choice_id=answer.choice_id if answer.choice_id in choice_ids else None,
+                is_correct=answer.is_correct,
+                time_taken=answer.time_taken,
+            )
+            for attempt, answers in decoded for answer in answers
+            if answer.question_id in question_ids
+        ]
+        UserAnswer.objects.bulk_create(rows, batch_size=1000)
+        QuizAttempt.objects.filter(id__in=[attempt.id for attempt in attempts]).update(packed_answers=None)
+    return len(attempts), len(rows)
+
+
+def _existing_ids(answers):
+    answers = list(answers)
+    question_ids = set(Question.objects.filter(
+        id__in={answer.question_id for answer in answers}
+    ).values_list('id', flat=True))
+    choice_ids = set(Choice.objects.filter(
+        id__in={answer.choice_id for answer in answers if answer.choice_id}
+    ).values_list('id', flat=True))
+    return question_ids, choice_ids
+
+
+def attempt_user_answers(attempt):
+    """
+    The answers of an attempt as UserAnswer objects with their question and
+    selected choice loaded. For a packed attempt they are built from the
+    packed value and not saved; answers to deleted questions are left out.
+    """
+    if attempt.packed_answers is None:
+        return list(UserAnswer.objects.filter(attempt=attempt).select_related('question', 'selected_choice'))
+    answers = unpack_answers(attempt.packed_answers)
+    questions = Question.objects.in_bulk([answer.question_id for answer in answers])
+    choices = Choice.objects.in_bulk([answer.choice_id for answer in answers if answer.choice_id])
+    return [
+        UserAnswer(
+            attempt=attempt,
+            question=questions[answer.question_id],
+            selected_choice=choices.get(answer.choice_id),
+            is_correct=answer.is_correct,
+            time_taken=answer.time_taken,
+        )
+        for answer in answers if answer.question_id in questions
+    ]
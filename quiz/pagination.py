@@ -0,0 +1,65 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are fetched with ``WHERE (a, b) < (last_a, last_b) ORDER BY a DESC,
+b DESC LIMIT n``, so every page costs the same whatever its depth, unlike
+OFFSET based pagination. The cursor is an opaque token holding the sort key
+of the last row of the previous page.
+"""
+
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 20
+
+
+def encode_cursor(values):
+    data = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, fields):
+    """
+    Turn a cursor back into python values for ``fields`` (model fields),
+    or None if the token is missing or malformed.
+    """
+    if not token:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(data)
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, keys=('created_at', 'id'), page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return ``(rows, next_cursor)`` for the page after ``cursor``, ordered by
+    ``keys`` descending. ``next_cursor`` is None on the last page. The last
+    key must be unique (normally the primary key).
+    """
+    fields = [queryset.model._meta.get_field(key) for key in keys]
+    values = decode_cursor(cursor, fields)
+    if values is not None:
+        # (k1, k2, ...) < (v1, v2, ...) spelled out for every backend
+        condition = Q()
+        for index in range(len(keys) - 1, -1, -1):
+            step = Q(**{f'{keys[index]}__lt': values[index]})
+            condition = step if index == len(keys) - 1 else step | (Q(**{keys[index]: values[index]}) & condition)
+        queryset = queryset.filter(condition)
+
+    rows = list(queryset.order_by(*[f'-{key}' for key in keys])[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        # value_to_string keeps full precision (microseconds included)
+        next_cursor = encode_cursor([field.value_to_string(last) for field in fields])
+    return rows, next_cursor
@@ -0,0 +1,179 @@
+"""
+On-demand request profiling.
+
+``PROFILING`` selects the mode:
+
+- ``off`` (default): the middleware removes itself, requests pay nothing.
+- ``header``: only requests from staff users sending ``X-Profile: 1`` are
+  profiled.
+- ``on``: additionally a ``PROFILE_SAMPLE_RATE`` fraction of all requests
+  is profiled.
+
+A profiled request runs under cProfile while a background thread samples
+its stack every ``PROFILE_SAMPLE_INTERVAL`` seconds. A profile asked for with
+the header is always kept, a sampled one only if the request took at least
+``PROFILE_THRESHOLD`` seconds (0 keeps every profile). Two files are written
+to ``PROFILE_DIR``: ``<name>.prof`` for pstats/snakeviz and
+``<name>.collapsed``, one ``frame;frame;frame count`` line per stack, for
+flamegraph.pl or speedscope. Staff download them from /admin/profiles/.
+"""
+
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+from django.utils import timezone
+
+PROFILE_HEADER = 'X-Profile'
+DUMP_SUFFIXES = ('.prof', '.collapsed')
+
+
+class StackSampler(threading.Thread):
+    """Samples the stack of one thread at a fixed interval into collapsed stacks."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """Must come after AuthenticationMiddleware, the header is staff only."""
+
+    def __init__(self, get_response):
+        if settings.PROFILING not in ('header', 'on'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        """``'header'`` or ``'sampled'`` when the request is profiled, else None."""
+        if request.headers.get(PROFILE_HEADER) == '1' and request.user.is_staff:
+            return 'header'
+        if settings.PROFILING == 'on' and random.random() < settings.PROFILE_SAMPLE_RATE:
+            return 'sampled'
+        return None
+
+    def __call__(self, request):
+        reason = self.should_profile(request)
+        if reason is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL)
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active (one at a time on Python 3.12+)
+            return self.get_response(request)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            duration = time.perf_counter() - start
+            profiler.disable()
+            sampler.stop()
+
+        # Staff asked for this one, so it is kept however fast it was
+        if reason == 'header' or duration >= settings.PROFILE_THRESHOLD:
+            response['X-Profile-Id'] = save_profile(request, duration, profiler, sampler)
+        return response
+
+
+def save_profile(request, duration, profiler, sampler):
+    match = getattr(request, 'resolver_match', None)
+    view = (match.view_name if match is not None else 'unresolved').replace(':', '-')
+    name = f'{timezone.now():%Y%m%d-%H%M%S}-{view}-{duration * 1000:.0f}ms-{uuid.uuid4().hex[:6]}'
+    directory = settings.PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(os.path.join(directory, f'{name}.prof'))
+    with open(os.path.join(directory, f'{name}.collapsed'), 'w') as stream:
+        stream.write(sampler.collapsed())
+    prune_profiles(directory, settings.PROFILE_KEEP)
+    return name
+
+
+def list_profiles(directory=None):
+    """Dumps in PROFILE_DIR as ``(name, modified, [(suffix, size)])``, newest first."""
+    directory = directory or settings.PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+    dumps = {}
+    for entry in os.scandir(directory):
+        name, suffix = os.path.splitext(entry.name)
+        if suffix in DUMP_SUFFIXES and entry.is_file():
+            stat = entry.stat()
+            modified, files = dumps.get(name, (0, []))
+            files.append((suffix, stat.st_size))
+            dumps[name] = (max(modified, stat.st_mtime), files)
+    return sorted(
+        ((name, modified, sorted(files)) for name, (modified, files) in dumps.items()),
+        key=lambda dump: dump[1], reverse=True,
+    )
+
+
+def prune_profiles(directory, keep):
+    for name, _, files in list_profiles(directory)[keep:]:
+        for suffix, _ in files:
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+@staff_member_required
+def profile_list(request):
+    profiles = [
+        (name, datetime.fromtimestamp(modified, tz=dt_timezone.utc), files)
+        for name, modified, files in list_profiles()
+    ]
+    context = dict(
+        admin.site.each_context(request),
+        title='Request profiles',
+        profiles=profiles,
+        mode=settings.PROFILING,
+    )
+    return render(request, 'admin/profiles.html', context)
+
+
+@staff_member_required
+def profile_download(request, filename):
+    name, suffix = os.path.splitext(filename)
+    if suffix not in DUMP_SUFFIXES or os.path.basename(filename) != filename:
+        raise Http404
+    path = os.path.join(settings.PROFILE_DIR, filename)
+    if not os.path.isfile(path):
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename)
@@ -0,0 +1,348 @@
+"""
+Importing and exporting question banks in bulk.
+
+A question bank file is JSON Lines or CSV (optionally gzipped), one
+question per line. As JSON::
+
+    {"quiz_id": 3, "external_key": "gk-0001", "question_text": "...",
+     "question_type": "multiple_choice", "points": 1, "time_limit": 60,
+     "is_active": true, "choices": [{"choice_text": "...", "is_correct": true}, ...]}
+
+In CSV the choices are the columns ``choice_1`` ... ``choice_N`` and
+``correct`` holds the number of the correct choice. Every field except
+``question_text`` and the choices is optional.
+
+``export_lines`` writes the same format, so an export can be imported
+again. ``external_key`` identifies a question across imports: importing a
+row whose key already exists in the quiz updates that question in place
+instead of adding a copy, so importing the same file twice changes nothing.
+Rows without a key are always added as new questions.
+
+Rows are written with ``bulk_create``/``bulk_update``, which skip model
+signals, so ``refresh_quiz_content`` does the signals' work (counters,
+layout and content versions, question pools, public pages) once per batch.
+"""
+
+import csv
+import json
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Prefetch, Q
+
+from .bundles import bump_content_version
+from .caching import bump_public_version
+from .counters import recompute_question_counters
+from .layouts import bump_layout_version
+from .models import Choice, Question, Quiz
+from .sampling import invalidate_question_pool
+from .streaming import Echo
+
+
+FORMATS = ('jsonl', 'csv')
+QUESTION_FIELDS = ('question_text', 'question_type', 'points', 'time_limit', 'is_active')
+QUESTION_TYPES = dict(Question.QUESTION_TYPES)
+CHOICE_TEXT_LENGTH = Choice._meta.get_field('choice_text').max_length
+EXTERNAL_KEY_LENGTH = Question._meta.get_field('external_key').max_length
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f', ''}
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return None
+
+
+def read_records(stream, fmt):
+    """
+    Yield ``(line_number, record)`` for every row of a question bank file,
+    reading one line at a time. CSV rows are turned into the JSON shape.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, _record_from_csv(row)
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as exc:
+            yield line_number, InvalidRecord(f'invalid JSON: {exc}')
+
+
+def _record_from_csv(row):
+    record = {key: value for key, value in row.items() if key and not key.startswith('choice_') and value != ''}
+    correct = str(record.pop('correct', '')).strip()
+    choice_columns = sorted(
+        (key for key in row if key and key.startswith('choice_') and key[7:].isdigit()),
+        key=lambda key: int(key[7:]),
+    )
+    record['choices'] = [
+        {'choice_text': row[key], 'is_correct': key == f'choice_{correct}'}
+        for key in choice_columns if row[key]
+    ]
+    return record
+
+
+def _integer(record, name, default):
+    value = record.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise InvalidRecord(f'{name} must be a whole number')
+    if value < 1:
+        raise InvalidRecord(f'{name} must be at least 1')
+    return value
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise InvalidRecord(f'invalid boolean: {value!r}')
+
+
+def clean_record(record, default_quiz_id=None):
+    """
+    Validate a raw record and return it with every field filled in and
+    converted, or raise InvalidRecord.
+    """
+    if isinstance(record, InvalidRecord):
+        raise record
+    if not isinstance(record, dict):
+        raise InvalidRecord('each row must be an object')
+
+    quiz_id = record.get('quiz_id', default_quiz_id)
+    if quiz_id in (None, ''):
+        raise InvalidRecord('quiz_id is missing (pass --quiz to set a default)')
+    try:
+        quiz_id = int(quiz_id)
+    except (TypeError, ValueError):
+        raise InvalidRecord('quiz_id must be a whole number')
+
+    question_text = str(record.get('question_text') or '').strip()
+    if not question_text:
+        raise InvalidRecord('question_text is empty')
+    question_type = record.get('question_type') or 'multiple_choice'
+    if question_type not in QUESTION_TYPES:
+        raise InvalidRecord(f'unknown question_type {question_type!r}')
+
+    external_key = record.get('external_key')
+    external_key = str(external_key).strip() if external_key not in (None, '') else None
+    if external_key and len(external_key) > EXTERNAL_KEY_LENGTH:
+        raise InvalidRecord(f'external_key is longer than {EXTERNAL_KEY_LENGTH} characters')
+
+    choices = record.get('choices')
+    if not isinstance(choices, list):
+        raise InvalidRecord('choices must be a list')
+    cleaned_choices = []
+    for choice in choices:
+        if not isinstance(choice, dict) or not str(choice.get('choice_text') or '').strip():
+            raise InvalidRecord('every choice needs a choice_text')
+        text = str(choice['choice_text']).strip()
+        if len(text) > CHOICE_TEXT_LENGTH:
+            raise InvalidRecord(f'choice text is longer than {CHOICE_TEXT_LENGTH} characters')
+        cleaned_choices.append((text, _boolean(choice.get('is_correct', False))))
+
+    correct = sum(is_correct for _, is_correct in cleaned_choices)
+    if question_type == 'true_false' and len(cleaned_choices) != 2:
+        raise InvalidRecord('a true/false question needs exactly two choices')
+    if len(cleaned_choices) < 2:
+        raise InvalidRecord('a question needs at least two choices')
+    if correct != 1:
+        raise InvalidRecord(f'a question needs exactly one correct choice, found {correct}')
+
+    return {
+        'quiz_id': quiz_id,
+        'external_key': external_key,
+        'question_text': question_text,
+        'question_type': question_type,
+        'points': _integer(record, 'points', 1),
+        'time_limit': _integer(record, 'time_limit', 60),
+        'is_active': _boolean(record.get('is_active', True)),
+        'choices': cleaned_choices,
+    }
+
+
+def existing_quiz_ids(quiz_ids):
+    return set(Quiz.objects.filter(pk__in=quiz_ids).values_list('pk', flat=True))
+
+
+def import_batch(records):
+    """
+    Write a batch of cleaned records in one transaction. Returns a dict with
+    the number of questions ``created``, ``updated`` and ``unchanged``.
+    """
+    # A key repeated within the batch: the last row wins
+    keyed = {}
+    unkeyed = []
+    for record in records:
+        if record['external_key']:
+            keyed[(record['quiz_id'], record['external_key'])] = record
+        else:
+            unkeyed.append(record)
+
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+    with transaction.atomic():
+        existing = {}
+        if keyed:
+            by_quiz = {}
+            for quiz_id, key in keyed:
+                by_quiz.setdefault(quiz_id, []).append(key)
+            condition = Q()
+            for quiz_id, keys in by_quiz.items():
+                condition |= Q(quiz_id=quiz_id, external_key__in=keys)
+            questions = Question.objects.filter(condition).prefetch_related(
+                Prefetch('choices', queryset=Choice.objects.order_by('id'))
+            )
+            existing = {(question.quiz_id, question.external_key): question for question in questions}
+
+        new_questions = []
+        new_choices = []
+        changed_questions = []
+        changed_choices = []
+        removed_choice_ids = []
+        for identity, record in list(keyed.items()) + [(None, record) for record in unkeyed]:
+            question = existing.get(identity)
+            if question is None:
+                question = Question(quiz_id=record['quiz_id'], external_key=record['external_key'])
+                for field in QUESTION_FIELDS:
+                    setattr(question, field, record[field])
+                new_questions.append((question, record['choices']))
+                continue
+
+            choices = list(question.choices.all())
+            if (
+                all(getattr(question, field) == record[field] for field in QUESTION_FIELDS)
+                and [(choice.choice_text, choice.is_correct) for choice in choices] == record['choices']
+            ):
+                counts['unchanged'] += 1
+                continue
+
+            counts['updated'] += 1
+            for field in QUESTION_FIELDS:
+                setattr(question, field, record[field])
+            changed_questions.append(question)
+            # Choices are matched by position and updated in place, so answers
+            # pointing at them survive; only surplus choices are deleted
+            for choice, (text, is_correct) in zip(choices, record['choices']):
+                if (choice.choice_text, choice.is_correct) != (text, is_correct):
+                    choice.choice_text, choice.is_correct = text, is_correct
+                    changed_choices.append(choice)
+            for text, is_correct in record['choices'][len(choices):]:
+                new_choices.append(Choice(question=question, choice_text=text, is_correct=is_correct))
+            removed_choice_ids.extend(choice.id for choice in choices[len(record['choices']):])
+
+        if new_questions:
+            questions = [question for question, _ in new_questions]
+            if connection.features.can_return_rows_from_bulk_insert:
+                Question.objects.bulk_create(questions)
+            else:
+                # Without RETURNING the new ids are unknown, and the choices need them
+                for question in questions:
+                    question.save()
+            for question, choices in new_questions:
+                new_choices.extend(
+                    Choice(question=question, choice_text=text, is_correct=is_correct)
+                    for text, is_correct in choices
+                )
+            counts['created'] = len(questions)
+
+        if changed_questions:
+            Question.objects.bulk_update(changed_questions, QUESTION_FIELDS)
+        if changed_choices:
+            Choice.objects.bulk_update(changed_choices, ['choice_text', 'is_correct'])
+        if removed_choice_ids:
+            Choice.objects.filter(id__in=removed_choice_ids).delete()
+        if new_choices:
+            Choice.objects.bulk_create(new_choices)
+
+        touched = {question.quiz_id for question, _ in new_questions}
+        touched.update(question.quiz_id for question in changed_questions)
+        if touched:
+            refresh_quiz_content(touched)
+    return counts
+
+
+def refresh_quiz_content(quiz_ids):
+    """
+    Do what the Question and Choice signals do, for questions written in
+    bulk: repair the counters, bump the layout and content versions and drop
+    the cached question pools and public pages of the given quizzes.
+    """
+    quiz_ids = sorted(quiz_ids)
+    recompute_question_counters(quiz_ids)
+    for quiz_id in quiz_ids:
+        bump_layout_version(quiz_id)
+
+    def invalidate():
+        for quiz_id in quiz_ids:
+            invalidate_question_pool(quiz_id)
+            bump_content_version(quiz_id)
+        bump_public_version()
+    transaction.on_commit(invalidate)
+
+
+def export_records(questions, chunk_size=1000):
+    """
+    Yield the records of ``questions`` (a Question queryset) in the import
+    format. Questions are read ``chunk_size`` at a time with their choices
+    prefetched per chunk, so memory does not grow with the bank.
+    """
+    questions = questions.order_by('quiz_id', 'id').prefetch_related(
+        Prefetch('choices', queryset=Choice.objects.order_by('id'))
+    )
+    for question in questions.iterator(chunk_size=chunk_size):
+        record = {'quiz_id': question.quiz_id, 'external_key': question.external_key}
+        record.update((field, getattr(question, field)) for field in QUESTION_FIELDS)
+        record['choices'] = [
+            {'choice_text': choice.choice_text, 'is_correct': choice.is_correct}
+            for choice in question.choices.all()
+        ]
+        yield record
+
+
+def csv_columns(questions):
+    """CSV header for exporting ``questions``, wide enough for the one with the most choices."""
+    choice_count = questions.annotate(choice_count=Count('choices')).aggregate(
+        most=Max('choice_count')
+    )['most'] or 0
+    return (
+        ['quiz_id', 'external_key', *QUESTION_FIELDS]
+        + [f'choice_{number}' for number in range(1, choice_count + 1)]
+        + ['correct']
+    )
+
+
+def export_lines(questions, fmt, chunk_size=1000):
+    """Yield the lines of a question bank file for ``questions``."""
+    records = export_records(questions, chunk_size=chunk_size)
+    if fmt == 'jsonl':
+        for record in records:
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+        return
+
+    columns = csv_columns(questions)
+    choice_columns = len(columns) - len(QUESTION_FIELDS) - 3
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for record in records:
+        choices = record.pop('choices')
+        correct = next((number for number, choice in enumerate(choices, 1) if choice['is_correct']), '')
+        texts = [choice['choice_text'] for choice in choices]
+        row = [record['quiz_id'], record['external_key'] or '']
+        row += [int(value) if isinstance(value, bool) else value for value in (record[field] for field in QUESTION_FIELDS)]
+        yield writer.writerow(row + texts + [''] * (choice_columns - len(texts)) + [correct])
@@ -0,0 +1,147 @@
+"""
+Streaming export of quiz attempts and their answers for analysis.
+
+One row per answer, carrying its attempt, user, quiz, question and chosen
+choice; an attempt without answers gets a single row with the answer
+columns empty. Attempts are walked by primary key (keyset iteration) a
+chunk at a time and the answers of each chunk are fetched with one joined
+query, so memory stays flat however many rows are exported. Packed answers
+are decoded, with the question and choice texts of the chunk looked up in
+two more queries.
+"""
+
+import csv
+import json
+from datetime import datetime, time
+
+from django.utils import timezone
+
+from .models import Choice, Question, QuizAttempt, UserAnswer
+from .packed_answers import unpack_answers
+from .streaming import Echo
+
+
+FORMATS = ('csv', 'jsonl')
+STATUS_CHOICES = ('all', 'completed', 'incomplete')
+
+ATTEMPT_COLUMNS = {
+    'attempt_id': 'id',
+    'user_id': 'user_id',
+    'username': 'user__username',
+    'quiz_id': 'quiz_id',
+    'quiz_title': 'quiz__title',
+    'started_at': 'started_at',
+    'completed_at': 'completed_at',
+    'is_completed': 'is_completed',
+    'score': 'score',
+    'max_score': 'max_score',
+    'total_questions': 'total_questions',
+    'attempt_seconds': 'time_taken',
+}
+ANSWER_COLUMNS = {
+    'question_id': 'question_id',
+    'question_text': 'question__question_text',
+    'choice_id': 'selected_choice_id',
+    'choice_text': 'selected_choice__choice_text',
+    'is_correct': 'is_correct',
+    'answer_seconds': 'time_taken',
+}
+COLUMNS = list(ATTEMPT_COLUMNS) + list(ANSWER_COLUMNS)
+
+
+def filter_attempts(quiz_ids=None, since=None, until=None, status='all'):
+    """
+    Attempts of the given quizzes started between the local dates ``since``
+    and ``until`` (both inclusive), optionally only completed or incomplete
+    ones.
+    """
+    attempts = QuizAttempt.objects.all()
+    if quiz_ids:
+        attempts = attempts.filter(quiz_id__in=quiz_ids)
+    if since is not None:
+        attempts = attempts.filter(started_at__gte=timezone.make_aware(datetime.combine(since, time.min)))
+    if until is not None:
+        attempts = attempts.filter(started_at__lte=timezone.make_aware(datetime.combine(until, time.max)))
+    if status != 'all':
+        attempts = attempts.filter(is_completed=status == 'completed')
+    return attempts
+
+
+def _clean(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat()
+    if hasattr(value, 'total_seconds'):
+        return value.total_seconds()
+    return value
+
+
+def export_rows(attempts, chunk_size=1000):
+    """Yield the export rows (dicts keyed by COLUMNS) of an attempt queryset."""
+    attempts = attempts.order_by('id').values(*ATTEMPT_COLUMNS.values(), 'packed_answers')
+    empty_answer = dict.fromkeys(ANSWER_COLUMNS)
+    last_id = 0
+    while True:
+        chunk = list(attempts.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        last_id = chunk[-1]['id']
+
+        answers = UserAnswer.objects.filter(
+            attempt_id__in=[attempt['id'] for attempt in chunk]
+        ).order_by('attempt_id', 'id').values_list('attempt_id', *ANSWER_COLUMNS.values())
+        by_attempt = {}
+        for attempt_id, *values in answers:
+            by_attempt.setdefault(attempt_id, []).append(
+                {column: _clean(value) for column, value in zip(ANSWER_COLUMNS, values)}
+            )
+        by_attempt.update(_packed_answer_rows(chunk))
+
+        for attempt in chunk:
+            row = {column: _clean(attempt[field]) for column, field in ATTEMPT_COLUMNS.items()}
+            for answer in by_attempt.get(attempt['id']) or [empty_answer]:
+                yield dict(row, **answer)
+
+
+def _packed_answer_rows(attempts):
+    """``{attempt id: [answer columns]}`` of the packed attempts among ``attempts``."""
+    packed = {
+        attempt['id']: unpack_answers(attempt['packed_answers'])
+        for attempt in attempts if attempt['packed_answers'] is not None
+    }
+    if not packed:
+        return {}
+    answers = [answer for attempt_answers in packed.values() for answer in attempt_answers]
+    question_texts = dict(Question.objects.filter(
+        id__in={answer.question_id for answer in answers}
+    ).values_list('id', 'question_text'))
+    choice_texts = dict(Choice.objects.filter(
+        id__in={answer.choice_id for answer in answers if answer.choice_id}
+    ).values_list('id', 'choice_text'))
+    return {
+        attempt_id: [
+            {
+                'question_id': answer.question_id,
+                'question_text': question_texts.get(answer.question_id),
+                'choice_id': answer.choice_id,
+                'choice_text': choice_texts.get(answer.choice_id),
+                'is_correct': answer.is_correct,
+                'answer_seconds': answer.time_taken,
+            }
+            for answer in attempt_answers
+        ]
+        for attempt_id, attempt_answers in packed.items()
+    }
+
+
+def export_lines(attempts, fmt, chunk_size=1000):
+    """Yield the lines of a CSV or JSON Lines export of an attempt queryset."""
+    rows = export_rows(attempts, chunk_size=chunk_size)
+    if fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+        return
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([row[column] for column in COLUMNS])
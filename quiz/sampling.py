@@ -0,0 +1,134 @@
+"""
+Random question sampling for quiz attempts.
+
+The cached pool only holds active question ids, sorted by points, plus the
+offsets where each points level starts. Picking questions samples positions
+in that list, so it never loads full Question rows and does not grow with
+the size of the question bank.
+
+The ids are cached in chunks of ``POOL_CHUNK_SIZE`` next to a small header
+with the number of ids and the strata, so a sample only reads the header
+and the chunks holding the positions it drew.
+"""
+
+import random
+import uuid
+
+from django.core.cache import cache
+
+
+POOL_CACHE_KEY = 'quiz:{quiz_id}:question_pool'
+POOL_CHUNK_KEY = 'quiz:{quiz_id}:question_pool:{generation}:{chunk}'
+POOL_CACHE_TIMEOUT = 60 * 60
+POOL_CHUNK_SIZE = 1000
+
+
+def _pool_key(quiz_id):
+    return POOL_CACHE_KEY.format(quiz_id=quiz_id)
+
+
+def _chunk_key(quiz_id, pool, chunk):
+    return POOL_CHUNK_KEY.format(quiz_id=quiz_id, generation=pool['generation'], chunk=chunk)
+
+
+def get_question_pool(quiz_id):
+    """
+    Return the pool header of the active questions of a quiz, a dict with
+    ``count`` ids ordered by ``(points, id)`` and ``strata``, mapping each
+    points value to the ``(start, end)`` positions holding it.
+    """
+    pool = cache.get(_pool_key(quiz_id))
+    if pool is None:
+        pool, _ = _build_question_pool(quiz_id)
+    return pool
+
+
+def _build_question_pool(quiz_id):
+    from .models import Question
+
+    ids = []
+    strata = {}
+    rows = Question.objects.filter(
+        quiz_id=quiz_id, is_active=True
+    ).order_by('points', 'id').values_list('id', 'points')
+    for position, (question_id, points) in enumerate(rows):
+        start, _ = strata.get(points, (position, position))
+        strata[points] = (start, position + 1)
+        ids.append(question_id)
+
+    # A new generation per build keeps chunks of an older pool out of it
+    pool = {'generation': uuid.uuid4().hex[:12], 'count': len(ids), 'strata': strata}
+    cache.set_many({
+        _chunk_key(quiz_id, pool, chunk): ids[start:start + POOL_CHUNK_SIZE]
+        for chunk, start in enumerate(range(0, len(ids), POOL_CHUNK_SIZE))
+    }, POOL_CACHE_TIMEOUT)
+    cache.set(_pool_key(quiz_id), pool, POOL_CACHE_TIMEOUT)
+    return pool, ids
+
+
+def _ids_at(quiz_id, pool, positions):
+    """The question ids at ``positions`` of the pool, reading only their chunks."""
+    needed = {position // POOL_CHUNK_SIZE for position in positions}
+    keys = {chunk: _chunk_key(quiz_id, pool, chunk) for chunk in needed}
+    found = cache.get_many(keys.values())
+    if len(found) < len(keys):
+        return None
+    chunks = {chunk: found[key] for chunk, key in keys.items()}
+    return [chunks[position // POOL_CHUNK_SIZE][position % POOL_CHUNK_SIZE] for position in positions]
+
+
+def invalidate_question_pool(quiz_id):
+    cache.delete(_pool_key(quiz_id))
+
+
+def _allocate(strata, count):
+    """Split ``count`` across strata proportionally (largest remainder)."""
+    total = sum(end - start for start, end in strata.values())
+    shares = {}
+    remainders = []
+    for points, (start, end) in strata.items():
+        exact = count * (end - start) / total
+        shares[points] = int(exact)
+        remainders.append((exact - int(exact), points))
+    left = count - sum(shares.values())
+    for _, points in sorted(remainders, reverse=True)[:left]:
+        shares[points] += 1
+    return shares
+
+
+def _sample_positions(pool, count, stratified, rng):
+    size = pool['count']
+    if size <= count:
+        return list(range(size))
+    if stratified:
+        positions = []
+        strata = pool['strata']
+        for points, share in _allocate(strata, count).items():
+            start, end = strata[points]
+            positions.extend(rng.sample(range(start, end), share))
+        return positions
+    return rng.sample(range(size), count)
+
+
+def sample_question_ids(quiz_id, count, stratified=False, rng=random):
+    """
+    Pick ``count`` active question ids of a quiz in random order.
+
+    With ``stratified=True`` every points level is represented in proportion
+    to its share of the question bank.
+    """
+    pool = cache.get(_pool_key(quiz_id))
+    ids = None
+    if pool is None:
+        pool, ids = _build_question_pool(quiz_id)
+    state = rng.getstate()
+    positions = _sample_positions(pool, count, stratified, rng)
+    picked = [ids[position] for position in positions] if ids is not None else _ids_at(quiz_id, pool, positions)
+    if picked is None:
+        # A chunk was evicted. The same seed must give the same questions,
+        # so the rebuilt pool is sampled with the generator as it was
+        rng.setstate(state)
+        pool, ids = _build_question_pool(quiz_id)
+        picked = [ids[position] for position in _sample_positions(pool, count, stratified, rng)]
+    rng.shuffle(picked)
+    return picked
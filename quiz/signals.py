@@ -0,0 +1,148 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .bundles import bump_content_version
+from .caching import bump_public_version
+from .counters import UNKNOWN, apply_question_change, recompute_question_counters
+from .layouts import bump_layout_version
+from .leaderboard import invalidate_quiz_rankings, touch_leaderboards
+from .models import Category, Choice, Question, Quiz, QuizAttempt
+from .sampling import invalidate_question_pool
+
+
+# Cache versions are bumped once the change is committed. Bumping earlier
+# would let a concurrent request cache the old data under the new version.
+
+# {quiz id: question pool changed} of the Question and Choice changes made
+# inside content_changes(), None outside
+_pending_changes = contextvars.ContextVar('quiz_pending_content_changes', default=None)
+
+
+@contextmanager
+def content_changes():
+    """
+    Bump the layout and content versions of the quizzes whose questions or
+    choices change in this block once, when it ends, instead of once per
+    saved or deleted row. Open it inside the transaction making the
+    changes; the admin wraps its forms, actions and deletes in one.
+    """
+    if _pending_changes.get() is not None:
+        yield
+        return
+    pending = {}
+    token = _pending_changes.set(pending)
+    try:
+        yield
+    finally:
+        _pending_changes.reset(token)
+    for quiz_id, pool_changed in sorted(pending.items()):
+        _bump_quiz_content(quiz_id, pool_changed)
+
+
+def _quiz_content_changed(quiz_id, pool_changed):
+    pending = _pending_changes.get()
+    if pending is None:
+        _bump_quiz_content(quiz_id, pool_changed)
+    else:
+        pending[quiz_id] = pending.get(quiz_id, False) or pool_changed
+
+
+def _bump_quiz_content(quiz_id, pool_changed):
+    bump_layout_version(quiz_id)
+    if pool_changed:
+        transaction.on_commit(lambda: invalidate_question_pool(quiz_id))
+    transaction.on_commit(lambda: bump_content_version(quiz_id))
+
+
+def _cascaded(sender, origin):
+    """Whether a delete signal comes from deleting some other model's rows."""
+    if origin is None:
+        return False
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is not sender
+
+
+@receiver([post_save, post_delete], sender=Quiz)
+def quiz_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_content_version(instance.id))
+
+
+@receiver([post_save, post_delete], sender=Quiz)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Question)
+def public_content_changed(sender, instance, **kwargs):
+    transaction.on_commit(bump_public_version)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Usernames appear on leaderboards; logins only save last_login
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    transaction.on_commit(bump_public_version)
+
+
+@receiver([post_save, post_delete], sender=QuizAttempt)
+def attempt_changed(sender, instance, **kwargs):
+    # Only completed attempts show up on public pages (leaderboards), so
+    # saving or deleting an incomplete one changes nothing there
+    if instance.is_completed:
+        transaction.on_commit(bump_public_version)
+        transaction.on_commit(lambda: touch_leaderboards(instance.quiz_id))
+
+
+@receiver(post_delete, sender=QuizAttempt)
+def completed_attempt_deleted(sender, instance, **kwargs):
+    # The cached ranking may hold the attempt as its user's best, also when
+    # it goes with its user or quiz
+    if instance.is_completed:
+        transaction.on_commit(lambda: invalidate_quiz_rankings([instance.quiz_id]))
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, origin=None, **kwargs):
+    # Deleting the quiz bumps its version itself
+    if _cascaded(sender, origin):
+        return
+    _quiz_content_changed(instance.quiz_id, pool_changed=True)
+    # A question moved to another quiz leaves the old quiz's pool and bundles
+    old_quiz_id = getattr(instance, '_loaded_quiz_id', instance.quiz_id)
+    if old_quiz_id != instance.quiz_id:
+        _quiz_content_changed(old_quiz_id, pool_changed=True)
+    instance._loaded_quiz_id = instance.quiz_id
+
+
+@receiver(post_save, sender=Question)
+def question_saved_update_counters(sender, instance, created, **kwargs):
+    old_state = None if created else getattr(instance, '_counted_state', UNKNOWN)
+    if old_state is UNKNOWN:
+        recompute_question_counters([instance.quiz_id])
+    else:
+        apply_question_change(old_state, instance.counter_state())
+    instance._counted_state = instance.counter_state()
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted_update_counters(sender, instance, origin=None, **kwargs):
+    if _cascaded(sender, origin):
+        return
+    apply_question_change(getattr(instance, '_counted_state', instance.counter_state()), None)
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def choice_changed(sender, instance, origin=None, **kwargs):
+    # Choices deleted with their question are covered by question_changed
+    if _cascaded(sender, origin):
+        return
+    if Choice.question.is_cached(instance):
+        quiz_id = instance.question.quiz_id
+    else:
+        quiz_id = Question.objects.filter(id=instance.question_id).values_list('quiz_id', flat=True).first()
+    if quiz_id is not None:
+        _quiz_content_changed(quiz_id, pool_changed=False)
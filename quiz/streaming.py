@@ -0,0 +1,45 @@
+"""
+Helpers for streaming large exports and imports line by line.
+"""
+
+import gzip
+import io
+import sys
+import zlib
+
+
+def open_text(path, mode='r'):
+    """Open a (possibly gzipped) text file; ``-`` reads stdin."""
+    if path == '-' and mode == 'r':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+class Echo:
+    """A file-like object whose ``write`` returns what is written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def gzip_chunks(lines, level=6, min_size=64 * 1024):
+    """
+    Gzip a stream of text lines on the fly, yielding compressed bytes in
+    pieces of roughly ``min_size`` or more.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    pending = []
+    size = 0
+    for line in lines:
+        data = compressor.compress(line.encode('utf-8'))
+        if data:
+            pending.append(data)
+            size += len(data)
+            if size >= min_size:
+                yield b''.join(pending)
+                pending = []
+                size = 0
+    pending.append(compressor.flush())
+    yield b''.join(pending)
@@ -0,0 +1,125 @@
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from .attempt_state import get_attempt_state
+from .models import Category, Choice, Question, Quiz, UserAnswer
+from .profiling import ProfilingMiddleware, list_profiles
+from .sampling import sample_question_ids
+
+
+class QuizListCategoryFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('author')
+        cls.category = Category.objects.create(name='Science')
+        Quiz.objects.create(title='Atoms', description='', category=cls.category, created_by=user)
+
+    def get_context(self, category):
+        with mock.patch('quiz.views.render', return_value=HttpResponse()) as render:
+            response = self.client.get(reverse('quiz:quiz_list'), {'category': category})
+        self.assertEqual(response.status_code, 200)
+        return render.call_args.args[2]
+
+    def test_category_filter(self):
+        context = self.get_context(str(self.category.id))
+        self.assertEqual(context['selected_category'], self.category.id)
+        self.assertEqual(len(context['quizzes']), 1)
+
+    def test_non_ascii_digit_is_ignored(self):
+        # '²'.isdigit() is True but int('²') raises ValueError
+        context = self.get_context('²')
+        self.assertIsNone(context['selected_category'])
+        self.assertEqual(len(context['quizzes']), 1)
+
+    def test_invalid_and_out_of_range_values_are_ignored(self):
+        for value in ('abc', '', '-1', '0', str(2 ** 63)):
+            with self.subTest(value=value):
+                self.assertIsNone(self.get_context(value)['selected_category'])
+
+
+class QuestionMoveTests(TestCase):
+    def test_moved_question_leaves_the_old_quiz_pool(self):
+        user = User.objects.create_user('author')
+        category = Category.objects.create(name='Science')
+        old_quiz, new_quiz = (
+            Quiz.objects.create(title=title, description='', category=category, created_by=user)
+            for title in ('Old', 'New')
+        )
+        question = Question.objects.create(quiz=old_quiz, question_text='Moved?')
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.create(quiz=old_quiz, question_text='Stays')
+        # Cache the old quiz's pool before the move
+        sample_question_ids(old_quiz.id, 10)
+
+        question = Question.objects.get(pk=question.pk)
+        question.quiz = new_quiz
+        with self.captureOnCommitCallbacks(execute=True):
+            question.save()
+
+        self.assertNotIn(question.id, sample_question_ids(old_quiz.id, 10))
+        self.assertIn(question.id, sample_question_ids(new_quiz.id, 10))
+
+
+class SubmitQuizTests(TestCase):
+    def setUp(self):
+        # Pools and attempt states live in the cache, which outlives test rollbacks
+        cache.clear()
+        self.user = User.objects.create_user('taker')
+        category = Category.objects.create(name='Science')
+        self.quiz = Quiz.objects.create(
+            title='Atoms', description='', category=category, created_by=self.user, questions_count=2,
+        )
+        for text in ('Smallest?', 'Lightest?'):
+            question = Question.objects.create(quiz=self.quiz, question_text=text)
+            Choice.objects.create(question=question, choice_text='Quark', is_correct=True)
+        self.client.force_login(self.user)
+        self.client.get(reverse('quiz:start_quiz', args=[self.quiz.id]))
+        # Answer the first question, so the view moves on to the second one
+        first = get_attempt_state(self.user.id, self.quiz.id)['question_ids'][0]
+        self.question = Question.objects.get(id=first)
+        self.choice = self.question.choices.get()
+
+    def submit(self, time_taken):
+        return self.client.post(reverse('quiz:submit_quiz', args=[self.quiz.id]), {
+            'question_id': self.question.id, 'choice_id': self.choice.id, 'time_taken': time_taken,
+        })
+
+    def test_invalid_time_taken_is_a_bad_request(self):
+        self.assertEqual(self.submit('abc').status_code, 400)
+        self.assertFalse(UserAnswer.objects.exists())
+
+    def test_valid_answer_is_saved(self):
+        self.assertEqual(self.submit('7').status_code, 302)
+        self.assertEqual(UserAnswer.objects.get().time_taken, 7)
+
+
+class ProfilingThresholdTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            PROFILING='on', PROFILE_SAMPLE_RATE=1.0, PROFILE_THRESHOLD=60, PROFILE_DIR=directory.name,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.directory = directory.name
+        self.middleware = ProfilingMiddleware(lambda request: HttpResponse())
+
+    def profile(self, headers=None):
+        request = RequestFactory().get('/', headers=headers)
+        request.user = User(username='staff', is_staff=True)
+        return self.middleware(request)
+
+    def test_fast_sampled_profile_is_dropped(self):
+        self.assertNotIn('X-Profile-Id', self.profile())
+        self.assertEqual(list_profiles(self.directory), [])
+
+    def test_fast_header_profile_is_kept(self):
+        response = self.profile({'X-Profile': '1'})
+        self.assertEqual([name for name, _, _ in list_profiles(self.directory)], [response['X-Profile-Id']])
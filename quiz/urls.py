@@ -8,6 +8,8 @@ urlpatterns = [
     path('quizzes/', views.quiz_list, name='quiz_list'),
     path('quiz/<int:quiz_id>/', views.quiz_detail, name='quiz_detail'),
     path('quiz/<int:quiz_id>/start/', views.start_quiz, name='start_quiz'),
+    path('quiz/<int:quiz_id>/play/', views.play_quiz, name='play_quiz'),
+    path('quiz/<int:quiz_id>/answers/', views.attempt_answers, name='attempt_answers'),
     path('quiz/<int:quiz_id>/question/<int:question_num>/', views.quiz_question, name='quiz_question'),
     path('quiz/<int:quiz_id>/submit/', views.submit_quiz, name='submit_quiz'),
     path('quiz/<int:quiz_id>/results/<int:attempt_id>/', views.quiz_results, name='quiz_results'),
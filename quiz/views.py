@@ -1,17 +1,34 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.urls import reverse
 from django.utils import timezone
-from django.db.models import Avg, Count, Q
-from datetime import timedelta
+from django.views.decorators.http import require_POST
+from django.db.models import F
 import json
 
-from .models import Quiz, Question, Choice, QuizAttempt, UserAnswer, Category
+from .attempt_state import (
+    clear_attempt_state, get_attempt_state, save_attempt, set_current_question, start_attempt_state,
+)
+from .attempts import InvalidAnswer, parse_answers, submit_answers
+from .bundles import (
+    get_content_changed_at, get_content_version, get_question_bundle, get_question_bundles, get_quiz_bundle,
+)
+from .caching import cache_public_page, conditional_page, get_public_changed_at, get_public_version
+from .layouts import attempt_question_ids, is_layout_current, layout_question_ids, new_seed, shuffle_choices
+from .leaderboard import (
+    PERIOD_CHOICES, add_usernames, get_leaderboard_changed_at, get_period_quiz_top, get_period_top_users,
+    get_quiz_ranking, get_top_users,
+)
+from .models import Quiz, QuizAttempt, UserAnswer, Category, UserCategorySummary, UserScoreSummary
+from .packed_answers import attempt_user_answers
+from .pagination import keyset_page
 
 
+@cache_public_page
 def home(request):
-    recent_quizzes = Quiz.objects.filter(is_active=True).order_by('-created_at')[:6]
+    recent_quizzes = Quiz.objects.filter(is_active=True).select_related('category').order_by('-created_at')[:6]
     categories = Category.objects.all()
     
     context = {
@@ -21,31 +38,57 @@ def home(request):
     return render(request, 'quiz/home.html', context)
 
 
+@cache_public_page
 def quiz_list(request):
-    quizzes = Quiz.objects.filter(is_active=True).order_by('-created_at')
+    quizzes = Quiz.objects.filter(is_active=True).select_related('category')
     categories = Category.objects.all()
     
     # Filter by category
-    category_id = request.GET.get('category')
-    if category_id:
-        quizzes = quizzes.filter(category_id=category_id)
+    try:
+        selected_category = int(request.GET.get('category', ''))
+    except ValueError:
+        selected_category = None
+    # Ids are positive 64-bit integers, anything else matches no category
+    if selected_category is not None and not 0 < selected_category < 2 ** 63:
+        selected_category = None
+    if selected_category:
+        quizzes = quizzes.filter(category_id=selected_category)
     
     # Filter by difficulty
     difficulty = request.GET.get('difficulty')
+    if difficulty not in dict(Quiz.DIFFICULTY_CHOICES):
+        difficulty = None
     if difficulty:
         quizzes = quizzes.filter(difficulty=difficulty)
     
+    # Each quiz carries its active_question_count, so no per-row queries
+    quizzes, next_cursor = keyset_page(quizzes, request.GET.get('cursor'))
+    
     context = {
         'quizzes': quizzes,
         'categories': categories,
-        'selected_category': int(category_id) if category_id else None,
+        'selected_category': selected_category,
         'selected_difficulty': difficulty,
+        'next_cursor': next_cursor,
     }
     return render(request, 'quiz/quiz_list.html', context)
 
 
+def _quiz_detail_etag(request, quiz_id):
+    # Public version covers renamed categories and users
+    return [get_content_version(quiz_id), get_public_version(), get_leaderboard_changed_at(quiz_id)]
+
+
+def _quiz_last_modified(request, quiz_id):
+    if get_quiz_bundle(quiz_id) is None:
+        return None
+    return max(get_content_changed_at(quiz_id), get_public_changed_at(), get_leaderboard_changed_at(quiz_id))
+
+
+@conditional_page(_quiz_detail_etag, _quiz_last_modified)
+@cache_public_page
 def quiz_detail(request, quiz_id):
-    quiz = get_object_or_404(Quiz, id=quiz_id, is_active=True)
+    quiz = get_object_or_404(Quiz.objects.select_related('category'), id=quiz_id, is_active=True)
     user_attempts = []
     
     if request.user.is_authenticated:
@@ -58,7 +101,7 @@ def quiz_detail(request, quiz_id):
     context = {
         'quiz': quiz,
         'user_attempts': user_attempts,
-        'total_questions': quiz.questions.filter(is_active=True).count(),
+        'total_questions': quiz.active_question_count,
     }
     return render(request, 'quiz/quiz_detail.html', context)
 
@@ -67,53 +110,137 @@ def quiz_detail(request, quiz_id):
 def start_quiz(request, quiz_id):
     quiz = get_object_or_404(Quiz, id=quiz_id, is_active=True)
     
-    # Create new quiz attempt
-    attempt = QuizAttempt.objects.create(
-        user=request.user,
-        quiz=quiz,
-        started_at=timezone.now(),
-        total_questions=quiz.questions_count
-    )
+    # Resume the open attempt at this quiz, if there is one
+    state = get_attempt_state(request.user.id, quiz.id)
+    if state is None:
+        # The layout (questions and choice order) is generated from the seed
+        seed = new_seed()
+        question_ids = layout_question_ids(quiz, seed, quiz.questions_count)
+        bundles = get_question_bundles(quiz.id, question_ids)
+        
+        # With a shared cache the attempt row is only written once the first
+        # answer arrives
+        state = start_attempt_state(
+            request.user.id, quiz, seed, question_ids,
+            max_score=sum(bundle['points'] for bundle in bundles.values())
+        )
     
-    # Store attempt ID in session
-    request.session['quiz_attempt_id'] = attempt.id
-    request.session['quiz_questions'] = [q.id for q in quiz.get_random_questions()]
-    request.session['current_question'] = 0
+    # Play mode: hand the whole attempt to the client in one response
+    if request.GET.get('format') == 'json':
+        return JsonResponse(_attempt_payload(quiz.id, state))
     
-    return redirect('quiz:quiz_question', quiz_id=quiz_id, question_num=1)
+    return redirect('quiz:quiz_question', quiz_id=quiz_id, question_num=state['current_question'] + 1)
+
+
+def _attempt_payload(quiz_id, state):
+    question_ids = state['question_ids']
+    bundles = get_question_bundles(quiz_id, question_ids)
+    answers = []
+    if state['attempt_id'] is not None:
+        answers = list(UserAnswer.objects.filter(attempt_id=state['attempt_id']).values(
+            'question_id', 'time_taken', choice_id=F('selected_choice_id')
+        ))
+    return {
+        'attempt_id': state['attempt_id'],
+        'quiz': get_quiz_bundle(quiz_id),
+        'questions': [
+            shuffle_choices(bundles[question_id], state['seed'])
+            for question_id in question_ids if question_id in bundles
+        ],
+        'answers': answers,
+        'current_question': max(state['current_question'], len(answers)),
+        'answers_url': reverse('quiz:attempt_answers', args=[quiz_id]),
+    }
 
 
 @login_required
-def quiz_question(request, quiz_id, question_num):
+def play_quiz(request, quiz_id):
     quiz = get_object_or_404(Quiz, id=quiz_id, is_active=True)
-    attempt_id = request.session.get('quiz_attempt_id')
-    question_ids = request.session.get('quiz_questions', [])
     
-    if not attempt_id or not question_ids:
+    context = {
+        'quiz': quiz,
+    }
+    return render(request, 'quiz/quiz_play.html', context)
+
+
+@login_required
+@require_POST
+def attempt_answers(request, quiz_id):
+    """
+    Batch answer endpoint for the user's open attempt at a quiz. Accepts
+    ``{"answers": [...], "final": bool}`` where each answer has
+    ``question_id``, ``choice_id`` and ``time_taken``. Used by play mode for
+    periodic checkpoints and the final submission.
+    """
+    state = get_attempt_state(request.user.id, quiz_id)
+    if state is None:
+        return JsonResponse({'error': 'Quiz session expired. Please start again.'}, status=410)
+    
+    try:
+        data = json.loads(request.body)
+        answers = parse_answers(data.get('answers', []))
+        final = bool(data.get('final'))
+    except (ValueError, AttributeError) as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    if not answers and not final:
+        return JsonResponse({'saved': 0, 'completed': False})
+    
+    attempt = save_attempt(request.user.id, quiz_id, state)
+    try:
+        submitted = submit_answers(
+            attempt, answers,
+            question_ids=state['question_ids'],
+            final=final
+        )
+    except InvalidAnswer as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    if not submitted:
+        clear_attempt_state(request.user.id, quiz_id)
+        return JsonResponse({'error': 'This attempt has already been submitted.'}, status=409)
+    
+    response = {'saved': len(answers), 'completed': final}
+    if final:
+        clear_attempt_state(request.user.id, quiz_id)
+        response['results_url'] = reverse('quiz:quiz_results', args=[quiz_id, attempt.id])
+    return JsonResponse(response)
+
+
+@login_required
+def quiz_question(request, quiz_id, question_num):
+    quiz = get_quiz_bundle(quiz_id)
+    if quiz is None or not quiz['is_active']:
+        raise Http404('No Quiz matches the given query.')
+
+    state = get_attempt_state(request.user.id, quiz_id)
+    if state is None:
         messages.error(request, 'Quiz session expired. Please start again.')
         return redirect('quiz:quiz_detail', quiz_id=quiz_id)
-    
-    attempt = get_object_or_404(QuizAttempt, id=attempt_id, user=request.user)
+    question_ids = state['question_ids']
     
     if question_num > len(question_ids):
         return redirect('quiz:submit_quiz', quiz_id=quiz_id)
     
     question_id = question_ids[question_num - 1]
-    question = get_object_or_404(Question, id=question_id)
+    question = get_question_bundle(quiz_id, question_id)
+    if question is None:
+        raise Http404('No Question matches the given query.')
+    question = shuffle_choices(question, state['seed'])
     
-    # Check if user already answered this question
-    existing_answer = UserAnswer.objects.filter(
-        attempt=attempt, 
-        question=question
-    ).first()
+    # An attempt that has not been saved yet has no answers
+    selected_choice_id = None
+    if state['attempt_id'] is not None:
+        selected_choice_id = UserAnswer.objects.filter(
+            attempt_id=state['attempt_id'],
+            question_id=question_id
+        ).values_list('selected_choice_id', flat=True).first()
     
     context = {
         'quiz': quiz,
         'question': question,
         'question_num': question_num,
         'total_questions': len(question_ids),
-        'existing_answer': existing_answer,
-        'time_limit': question.time_limit,
+        'selected_choice_id': selected_choice_id,
+        'time_limit': question['time_limit'],
     }
     return render(request, 'quiz/quiz_question.html', context)
 
@@ -121,86 +248,78 @@ def quiz_question(request, quiz_id, question_num):
 @login_required
 def submit_quiz(request, quiz_id):
     quiz = get_object_or_404(Quiz, id=quiz_id, is_active=True)
-    attempt_id = request.session.get('quiz_attempt_id')
+    state = get_attempt_state(request.user.id, quiz_id)
     
-    if not attempt_id:
+    if state is None:
         messages.error(request, 'Quiz session expired.')
         return redirect('quiz:quiz_detail', quiz_id=quiz_id)
     
-    attempt = get_object_or_404(QuizAttempt, id=attempt_id, user=request.user)
+    attempt = None
+    if state['attempt_id'] is not None:
+        attempt = get_object_or_404(QuizAttempt, id=state['attempt_id'], user=request.user)
+    question_ids = state['question_ids']
     
     if request.method == 'POST':
         # Process answer submission
         question_id = request.POST.get('question_id')
         choice_id = request.POST.get('choice_id')
-        time_taken = int(request.POST.get('time_taken', 0))
+        time_taken = request.POST.get('time_taken', 0)
         
+        answers = []
         if question_id and choice_id:
-            question = get_object_or_404(Question, id=question_id)
-            choice = get_object_or_404(Choice, id=choice_id)
-            
-            # Save or update user answer
-            user_answer, created = UserAnswer.objects.get_or_create(
-                attempt=attempt,
-                question=question,
-                defaults={
-                    'selected_choice': choice,
-                    'is_correct': choice.is_correct,
-                    'time_taken': time_taken
-                }
-            )
-            
-            if not created:
-                user_answer.selected_choice = choice
-                user_answer.is_correct = choice.is_correct
-                user_answer.time_taken = time_taken
-                user_answer.save()
+            answers = [{'question_id': question_id, 'choice_id': choice_id, 'time_taken': time_taken}]
+        try:
+            answers = parse_answers(answers)
+        except InvalidAnswer as exc:
+            return HttpResponseBadRequest(str(exc))
+        
+        final = bool(request.POST.get('final_submit'))
+        submitted = True
+        try:
+            if answers or final:
+                # First answer of a new attempt: save the attempt now
+                attempt = save_attempt(request.user.id, quiz_id, state)
+                submitted = submit_answers(
+                    attempt, answers,
+                    question_ids=question_ids,
+                    final=final
+                )
+        except InvalidAnswer:
+            raise Http404('No Choice matches the given query.')
         
         # Check if this is the final submission
-        if request.POST.get('final_submit'):
-            # Calculate final score
-            correct_answers = UserAnswer.objects.filter(
-                attempt=attempt, 
-                is_correct=True
-            ).count()
-            
-            attempt.score = correct_answers
-            attempt.is_completed = True
-            attempt.time_taken = timezone.now() - attempt.started_at
-            attempt.save()
-            
-            # Clear session
-            request.session.pop('quiz_attempt_id', None)
-            request.session.pop('quiz_questions', None)
-            request.session.pop('current_question', None)
+        if final or not submitted:
+            clear_attempt_state(request.user.id, quiz_id)
             
             return redirect('quiz:quiz_results', quiz_id=quiz_id, attempt_id=attempt.id)
         
-        # Move to next question
-        current_question = request.session.get('current_question', 0)
+        # Move to the question after the one just answered
+        current_question = state['current_question']
+        if answers:
+            current_question = question_ids.index(answers[0][0])
         next_question = current_question + 1
-        request.session['current_question'] = next_question
+        set_current_question(request.user.id, quiz_id, state, next_question)
         
-        question_ids = request.session.get('quiz_questions', [])
         if next_question < len(question_ids):
             return redirect('quiz:quiz_question', quiz_id=quiz_id, question_num=next_question + 1)
         else:
             # Show final submission page
+            if attempt is not None:
+                attempt.refresh_from_db(fields=['score', 'answered_count'])
             context = {
                 'quiz': quiz,
                 'attempt': attempt,
                 'total_questions': len(question_ids),
-                'answered_questions': UserAnswer.objects.filter(attempt=attempt).count(),
+                'answered_questions': attempt.answered_count if attempt else 0,
             }
             return render(request, 'quiz/submit_quiz.html', context)
     
     # GET request - show submission page
-    question_ids = request.session.get('quiz_questions', [])
     context = {
         'quiz': quiz,
         'attempt': attempt,
         'total_questions': len(question_ids),
-        'answered_questions': UserAnswer.objects.filter(attempt=attempt).count(),
+        'answered_questions': attempt.answered_count if attempt else 0,
     }
     return render(request, 'quiz/submit_quiz.html', context)
 
@@ -210,28 +329,48 @@ def quiz_results(request, quiz_id, attempt_id):
     quiz = get_object_or_404(Quiz, id=quiz_id)
     attempt = get_object_or_404(QuizAttempt, id=attempt_id, user=request.user, quiz=quiz)
     
-    user_answers = UserAnswer.objects.filter(attempt=attempt).select_related(
-        'question', 'selected_choice'
-    )
+    # From the UserAnswer rows or, once packed, from attempt.packed_answers
+    user_answers = attempt_user_answers(attempt)
+    
+    # Show answers in the order the questions were asked, rebuilt from the seed
+    attempt.quiz = quiz
+    positions = {question_id: index for index, question_id in enumerate(attempt_question_ids(attempt))}
+    user_answers = sorted(user_answers, key=lambda answer: positions.get(answer.question_id, len(positions)))
     
     context = {
         'quiz': quiz,
         'attempt': attempt,
         'user_answers': user_answers,
         'percentage': attempt.get_percentage(),
+        'layout_is_current': is_layout_current(attempt),
     }
     return render(request, 'quiz/quiz_results.html', context)
 
 
+def _leaderboard_period(request):
+    period = request.GET.get('period')
+    return period if period in dict(PERIOD_CHOICES) else None
+
+
+def _leaderboard_etag(request):
+    # Public version covers renamed users/quizzes, the date rolls over periods
+    return [get_public_version(), get_leaderboard_changed_at(), timezone.localdate()]
+
+
+def _leaderboard_last_modified(request):
+    return max(get_public_changed_at(), get_leaderboard_changed_at())
+
+
+@conditional_page(_leaderboard_etag, _leaderboard_last_modified)
+@cache_public_page
 def leaderboard(request):
-    # Overall leaderboard
-    top_users = QuizAttempt.objects.filter(is_completed=True).values(
-        'user__username'
-    ).annotate(
-        total_score=models.Sum('score'),
-        total_attempts=Count('id'),
-        avg_score=Avg('score')
-    ).order_by('-total_score')[:10]
+    # Overall leaderboard, read from the precomputed summaries or, for a
+    # day/week/month board, from the daily rollups of that period
+    period = _leaderboard_period(request)
+    if period:
+        top_users = get_period_top_users(period, 10)
+    else:
+        top_users = get_top_users(10)
     
     recent_attempts = QuizAttempt.objects.filter(
         is_completed=True
@@ -240,21 +379,43 @@ def leaderboard(request):
     context = {
         'top_users': top_users,
         'recent_attempts': recent_attempts,
+        'period': period,
+        'period_choices': PERIOD_CHOICES,
     }
     return render(request, 'quiz/leaderboard.html', context)
 
 
+def _quiz_leaderboard_etag(request, quiz_id):
+    return [
+        get_content_version(quiz_id), get_public_version(), get_leaderboard_changed_at(quiz_id), timezone.localdate(),
+    ]
+
+
+@conditional_page(_quiz_leaderboard_etag, _quiz_last_modified)
+@cache_public_page
 def quiz_leaderboard(request, quiz_id):
     quiz = get_object_or_404(Quiz, id=quiz_id)
     
-    top_attempts = QuizAttempt.objects.filter(
-        quiz=quiz, 
-        is_completed=True
-    ).select_related('user').order_by('-score', 'time_taken')[:10]
+    ranking = get_quiz_ranking(quiz.id)
+    user_rank = None
+    nearby_attempts = []
+    if request.user.is_authenticated:
+        user_rank = ranking.rank(request.user.id)
+        nearby_attempts = ranking.around(request.user.id)
+    
+    top_attempts = ranking.top(10)
+    add_usernames(top_attempts, nearby_attempts)
+    period = _leaderboard_period(request)
     
     context = {
         'quiz': quiz,
         'top_attempts': top_attempts,
+        'total_ranked': len(ranking),
+        'user_rank': user_rank,
+        'nearby_attempts': nearby_attempts,
+        'period': period,
+        'period_choices': PERIOD_CHOICES,
+        'period_top_users': get_period_quiz_top(quiz.id, period, 10) if period else None,
     }
     return render(request, 'quiz/quiz_leaderboard.html', context)
 
@@ -264,9 +425,19 @@ def my_results(request):
     attempts = QuizAttempt.objects.filter(
         user=request.user, 
         is_completed=True
-    ).select_related('quiz').order_by('-completed_at')
+    ).select_related('quiz')
+    attempts, next_cursor = keyset_page(attempts, request.GET.get('cursor'), keys=('completed_at', 'id'))
+    
+    # Header statistics come from the summaries kept up to date on completion
+    summary = UserScoreSummary.objects.filter(user=request.user).first()
+    category_summaries = UserCategorySummary.objects.filter(
+        user=request.user
+    ).select_related('category').order_by('category__name')
     
     context = {
         'attempts': attempts,
+        'next_cursor': next_cursor,
+        'summary': summary,
+        'category_summaries': category_summaries,
     }
     return render(request, 'quiz/my_results.html', context)
@@ -33,11 +33,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'quiz.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'quiz.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -46,7 +48,8 @@ ROOT_URLCONF = 'quiz_platform.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also times renders for quiz/metrics.py
+        'BACKEND': 'quiz.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -55,6 +58,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'quiz.context_processors.public_cache_version',
             ],
         },
     },
@@ -74,6 +78,92 @@ DATABASES = {
     }
 }
 
+# Cache Configuration
+# CACHE_BACKEND picks the backend: 'locmem' (default, per process), 'file' or
+# 'db' (shared between workers on one host / one database) or 'redis'.
+# The db backend needs `python manage.py createcachetable` once.
+# With locmem every invalidation (public page version, quiz bundles, rankings)
+# only reaches the process that made it, so other workers keep serving stale
+# entries until they expire (bundles after 24 hours); deployments with more
+# than one worker process must use 'file', 'db' or 'redis'.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'quiz-platform'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', BASE_DIR / 'cache'),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'quiz_cache'),
+    },
+    'redis': {
+        # Requires the redis package (pip install redis)
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
+}
+CACHES = {
+    'default': dict(
+        CACHE_BACKENDS[CACHE_BACKEND],
+        KEY_PREFIX=os.environ.get('CACHE_KEY_PREFIX', 'quiz'),
+        TIMEOUT=int(os.environ.get('CACHE_TIMEOUT', 300)),
+    ),
+}
+
+# Seconds anonymous responses of public pages are cached for
+PUBLIC_PAGE_CACHE_TIMEOUT = int(os.environ.get('PUBLIC_PAGE_CACHE_TIMEOUT', 300))
+# max-age sent to browsers and reverse proxies for anonymous public pages
+PUBLIC_PROXY_CACHE_TIMEOUT = int(os.environ.get('PUBLIC_PROXY_CACHE_TIMEOUT', 30))
+
+# Sessions only hold login state; in-progress quizzes live in the cache
+# (quiz/attempt_state.py). 'django.contrib.sessions.backends.cached_db' also
+# serves session reads from the cache.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.db')
+
+# Pack the answers of completed attempts into QuizAttempt.packed_answers
+# instead of keeping UserAnswer rows (quiz/packed_answers.py)
+PACK_COMPLETED_ANSWERS = os.environ.get('PACK_COMPLETED_ANSWERS', 'False').lower() == 'true'
+
+# Request metrics (quiz/metrics.py), served at /metrics in the Prometheus format
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+# Scrapers send "Authorization: Bearer <METRICS_TOKEN>". METRICS_ALLOWED_IPS
+# (opt-in) need no token; behind a reverse proxy every request comes from the
+# proxy's address, so only list addresses that reach the app directly.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip]
+# Requests slower than this many seconds are logged with their slowest queries
+SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 1.0))
+SLOW_REQUEST_QUERIES = int(os.environ.get('SLOW_REQUEST_QUERIES', 3))
+
+# Request profiling (quiz/profiling.py): 'off', 'header' (staff sending
+# "X-Profile: 1") or 'on' (the header plus a sample of all requests)
+PROFILING = os.environ.get('PROFILING', 'off').lower()
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.01))
+# Sampled profiles of requests faster than this many seconds are thrown away;
+# ones asked for with the X-Profile header are always kept
+PROFILE_THRESHOLD = float(os.environ.get('PROFILE_THRESHOLD', 0.5))
+# Seconds between stack samples for the collapsed (flame graph) output
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', BASE_DIR / 'profiles')
+# Only the newest profiles are kept
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'quiz': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
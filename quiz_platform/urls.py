@@ -2,8 +2,14 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from quiz.metrics import metrics
+from quiz.profiling import profile_download, profile_list
+
 urlpatterns = [
+    path('admin/profiles/', profile_list, name='profile_list'),
+    path('admin/profiles/<str:filename>', profile_download, name='profile_download'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics, name='metrics'),
     path('', include('quiz.urls')),
     path('accounts/', include('accounts.urls')),
 ]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Benchmark for the start_quiz view
+Measures start_quiz latency for growing question banks (100 to 100k questions)
+Runs against a throwaway test database, your data is not touched
+"""
+
+import os
+import sys
+import time
+import statistics
+
+# Setup Django environment
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quiz_platform.settings')
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from quiz.attempt_state import clear_attempt_state
+from quiz.models import Category, Quiz, Question
+
+BANK_SIZES = [100, 1000, 10000, 100000]
+RUNS = 50
+
+
+def create_quiz(user, category, size):
+    quiz = Quiz.objects.create(
+        title=f'Benchmark quiz ({size} questions)',
+        description='Benchmark',
+        category=category,
+        questions_count=10,
+        created_by=user,
+    )
+    Question.objects.bulk_create(
+        [
+            Question(quiz=quiz, question_text=f'Question {i}', points=1 + i % 3)
+            for i in range(size)
+        ],
+        batch_size=5000,
+    )
+    return quiz
+
+
+def benchmark_start_quiz():
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['*']
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+    try:
+        user = User.objects.create_user('bench', password='bench123')
+        category = Category.objects.create(name='Benchmark')
+        client = Client()
+        client.force_login(user)
+
+        print(f"{'questions':>10} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10}")
+        for size in BANK_SIZES:
+            quiz = create_quiz(user, category, size)
+            url = reverse('quiz:start_quiz', args=[quiz.id])
+            client.get(url)  # warm the question pool
+
+            timings = []
+            for _ in range(RUNS):
+                # Otherwise start_quiz resumes the attempt started by the last run
+                clear_attempt_state(user.id, quiz.id)
+                start = time.perf_counter()
+                client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            timings.sort()
+            print(f"{size:>10} {statistics.mean(timings):>10.2f} "
+                  f"{statistics.median(timings):>10.2f} {timings[int(RUNS * 0.95) - 1]:>10.2f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    benchmark_start_quiz()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+Benchmark for every view in quiz/urls.py
+Generates a synthetic dataset (generate_load_data), requests each view as a
+logged-in user and reports latency and SQL query counts.
+Exits with status 1 when a view goes over its query budget or fails.
+Pages whose template is not in templates/ are rendered with the stubs in
+scripts/benchmark_templates, which read the fields a real page shows; a view
+that still cannot find its template fails the run.
+Runs against a throwaway test database, your data is not touched
+
+    python scripts/benchmark_views.py --users 2000 --attempts 50000
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+# Setup Django environment
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPTS_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quiz_platform.settings')
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.template import TemplateDoesNotExist
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+from quiz import urls as quiz_urls
+from quiz.attempt_state import get_attempt_state
+from quiz.models import Choice, Quiz, QuizAttempt
+
+# Most SQL queries a view may run: the queries it is meant to run, listed
+# next to each budget, plus one of headroom. Every request of a logged-in
+# user costs two queries (session and user) before the view starts, and
+# transactions count BEGIN and COMMIT. A query per row of a page (10 or more
+# rows) goes far over the headroom, which is what the budgets are there for.
+QUERY_BUDGETS = {
+    'home': 3,               # page data comes from the cache
+    'quiz_list': 5,          # quizzes page, categories
+    'quiz_detail': 5,        # quiz with category, recent attempts
+    'start_quiz': 4,         # quiz
+    'play_quiz': 4,          # quiz
+    'attempt_answers': 9,    # locked attempt, choices, answered questions, insert
+    'quiz_question': 4,      # selected choice
+    'submit_quiz': 11,       # quiz, attempt, then as attempt_answers
+    'quiz_results': 6,       # quiz, attempt, answers
+    'leaderboard': 5,        # top summaries, recent attempts
+    'quiz_leaderboard': 5,   # quiz, usernames of the ranking rows
+    'my_results': 6,         # attempts page, summary, category summaries
+}
+
+
+def build_cases(client, user, quiz, attempt):
+    """Return ``{url name: (method, url, data)}`` for every view."""
+    client.get(reverse('quiz:start_quiz', args=[quiz.id]))
+    state = get_attempt_state(user.id, quiz.id)
+    question_id = state['question_ids'][0]
+    choice_id = Choice.objects.filter(question_id=question_id).values_list('id', flat=True).first()
+    answer = {'question_id': question_id, 'choice_id': choice_id, 'time_taken': 5}
+
+    return {
+        'home': ('get', reverse('quiz:home'), None),
+        'quiz_list': ('get', reverse('quiz:quiz_list'), None),
+        'quiz_detail': ('get', reverse('quiz:quiz_detail', args=[quiz.id]), None),
+        'start_quiz': ('get', reverse('quiz:start_quiz', args=[quiz.id]), None),
+        'play_quiz': ('get', reverse('quiz:play_quiz', args=[quiz.id]), None),
+        'attempt_answers': ('post_json', reverse('quiz:attempt_answers', args=[quiz.id]), {'answers': [answer]}),
+        'quiz_question': ('get', reverse('quiz:quiz_question', args=[quiz.id, 1]), None),
+        'submit_quiz': ('post', reverse('quiz:submit_quiz', args=[quiz.id]), answer),
+        'quiz_results': ('get', reverse('quiz:quiz_results', args=[quiz.id, attempt.id]), None),
+        'leaderboard': ('get', reverse('quiz:leaderboard'), None),
+        'quiz_leaderboard': ('get', reverse('quiz:quiz_leaderboard', args=[quiz.id]), None),
+        'my_results': ('get', reverse('quiz:my_results'), None),
+    }
+
+
+def request(client, method, url, data):
+    if method == 'post_json':
+        return client.post(url, json.dumps(data), content_type='application/json')
+    if method == 'post':
+        return client.post(url, data)
+    return client.get(url)
+
+
+class TemplateMissing(Exception):
+    pass
+
+
+def not_template_missing(record):
+    # Missing templates are reported in the summary, without a traceback each
+    return not (record.exc_info and isinstance(record.exc_info[1], TemplateDoesNotExist))
+
+
+def benchmark_view(client, case, runs):
+    response = request(client, *case)  # warm caches
+    exc_info = getattr(response, 'exc_info', None)
+    if exc_info is not None and isinstance(exc_info[1], TemplateDoesNotExist):
+        raise TemplateMissing(exc_info[1])
+    timings = []
+    queries = 0
+    statuses = set()
+    for _ in range(runs):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = request(client, *case)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = max(queries, len(context.captured_queries))
+        statuses.add(response.status_code)
+    timings.sort()
+    return timings, queries, statuses
+
+
+def benchmark_views(options):
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['*']
+    # After the project's own directories, so real templates win over stubs
+    settings.TEMPLATES[0]['DIRS'] = [
+        *settings.TEMPLATES[0]['DIRS'], os.path.join(SCRIPTS_DIR, 'benchmark_templates'),
+    ]
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    cache.clear()
+
+    failures = []
+    logging.getLogger('django.request').addFilter(not_template_missing)
+    try:
+        print('Generating data...')
+        call_command(
+            'generate_load_data',
+            users=options.users, quizzes=options.quizzes, questions=options.questions,
+            attempts=options.attempts, seed=options.seed, stdout=io.StringIO(),
+        )
+        # The busiest quiz and its most active user
+        quiz = Quiz.objects.annotate(attempt_count=Count('quizattempt')).order_by('-attempt_count').first()
+        busiest = QuizAttempt.objects.filter(quiz=quiz).values('user').annotate(
+            attempt_count=Count('id')
+        ).order_by('-attempt_count').first()
+        attempt = QuizAttempt.objects.filter(quiz=quiz, user_id=busiest['user']).select_related('user').first()
+        user = attempt.user
+
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        cases = build_cases(client, user, quiz, attempt)
+
+        names = [pattern.name for pattern in quiz_urls.urlpatterns]
+        print(f"{'view':<18} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'budget':>7}  status")
+        for name in names:
+            if name not in cases or name not in QUERY_BUDGETS:
+                failures.append(f'{name}: no benchmark case or query budget')
+                continue
+            try:
+                timings, queries, statuses = benchmark_view(client, cases[name], options.runs)
+            except TemplateMissing as exc:
+                failures.append(f'{name}: template {exc} does not exist')
+                continue
+            budget = QUERY_BUDGETS[name]
+            errors = sorted(status for status in statuses if status >= 400)
+            if queries > budget:
+                failures.append(f'{name}: {queries} queries, budget is {budget}')
+            if errors:
+                failures.append(f'{name}: responded with {errors}')
+            print(f"{name:<18} {statistics.median(timings):>9.2f} "
+                  f"{timings[max(int(len(timings) * 0.95) - 1, 0)]:>9.2f} {queries:>8} {budget:>7}  "
+                  f"{','.join(map(str, sorted(statuses)))}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    for failure in failures:
+        print(f'FAIL {failure}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark every quiz view against a synthetic dataset')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--quizzes', type=int, default=20)
+    parser.add_argument('--questions', type=int, default=100)
+    parser.add_argument('--attempts', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    sys.exit(benchmark_views(parser.parse_args()))
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+"""
+Load test for a running Quiz Platform server
+Each virtual user registers (or logs in), starts a quiz, opens and answers
+every question, submits the quiz and opens the results, like a real test
+taker. Reports throughput, error rates and p50/p95/p99 latency per URL name.
+
+    python manage.py runserver   # or gunicorn quiz_platform.wsgi
+    python scripts/load_test.py --quiz 1 --users 200 --ramp-up 60 --think-time 2:8
+    python scripts/load_test.py --quiz 1 --users 500 --spike 0.8 --spike-at 10 --processes 4
+
+--spike starts that fraction of the users at the same moment (--spike-at
+seconds into the run), like a class starting an exam together; the rest
+are spread evenly over --ramp-up. Use --login PREFIX to log in users made
+by generate_load_data instead of registering new ones.
+"""
+
+import argparse
+import http.client
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+# Setup Django environment (only used to name URLs)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quiz_platform.settings')
+
+import django
+django.setup()
+
+from django.urls import Resolver404, resolve
+
+QUESTION_ID_RE = re.compile(r'name="question_id"\s+value="(\d+)"')
+CHOICE_ID_RE = re.compile(r'name="choice_id"[^>]*?value="(\d+)"', re.S)
+
+
+class FlowError(Exception):
+    pass
+
+
+def url_name(path):
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        return path
+    return f'{match.namespace}:{match.url_name}' if match.namespace else match.url_name
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = max(int(round(fraction * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class Browser:
+    """One virtual user: a keep-alive connection and a cookie jar."""
+
+    def __init__(self, base_url, timeout, samples):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=timeout)
+        self.cookies = {}
+        self.samples = samples
+
+    def request(self, method, path, data=None):
+        """Send a request and return ``(status, location, body)``. Redirects are not followed."""
+        headers = {}
+        body = None
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        if method == 'POST':
+            data = dict(data or {}, csrfmiddlewaretoken=self.cookies.get('csrftoken', ''))
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        name = url_name(path)
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read().decode('utf-8', 'replace')
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.samples.append((name, 0, time.perf_counter() - start))
+            raise FlowError(f'{method} {path}: connection failed')
+        self.samples.append((name, response.status, time.perf_counter() - start))
+
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for morsel in SimpleCookie(header).values():
+                self.cookies[morsel.key] = morsel.value
+        if response.status >= 400:
+            raise FlowError(f'{method} {path}: HTTP {response.status}')
+        location = response.headers.get('Location')
+        if location:
+            location = urlsplit(location).path or location
+        return response.status, location, content
+
+
+def sign_in(browser, options, user_number):
+    if options.login:
+        browser.request('GET', '/accounts/login/')
+        status, _, _ = browser.request('POST', '/accounts/login/', {
+            'username': f'{options.login}_user_{user_number}', 'password': options.password,
+        })
+    else:
+        username = f'lt_{uuid.uuid4().hex[:12]}'
+        browser.request('GET', '/accounts/register/')
+        status, _, _ = browser.request('POST', '/accounts/register/', {
+            'username': username, 'password1': options.password, 'password2': options.password,
+        })
+    if status != 302:
+        raise FlowError('registration or login failed')
+
+
+def run_session(browser, options, rng):
+    """Take one quiz from start to results."""
+    quiz_id = rng.choice(options.quiz)
+    _, location, _ = browser.request('GET', f'/quiz/{quiz_id}/start/')
+    while location and '/question/' in location:
+        _, _, page = browser.request('GET', location)
+        question = QUESTION_ID_RE.search(page)
+        choices = CHOICE_ID_RE.findall(page)
+        if question is None or not choices:
+            raise FlowError(f'no question form on {location}')
+        think(options, rng)
+        _, location, _ = browser.request('POST', f'/quiz/{quiz_id}/submit/', {
+            'question_id': question.group(1),
+            'choice_id': rng.choice(choices),
+            'time_taken': rng.randint(1, 30),
+        })
+
+    _, location, _ = browser.request('POST', f'/quiz/{quiz_id}/submit/', {'final_submit': '1'})
+    if not location or '/results/' not in location:
+        raise FlowError('final submission did not lead to the results page')
+    browser.request('GET', location)
+
+
+def think(options, rng):
+    low, high = options.think_time
+    if high > 0:
+        time.sleep(rng.uniform(low, high))
+
+
+def virtual_user(options, user_number, start_at, samples, outcomes):
+    rng = random.Random(f'{options.seed}:{user_number}')
+    time.sleep(max(start_at - time.time(), 0))
+    browser = Browser(options.base_url, options.timeout, samples)
+    try:
+        sign_in(browser, options, user_number)
+        for _ in range(options.sessions):
+            run_session(browser, options, rng)
+            outcomes.append(True)
+    except Exception:
+        # Any failure ends this virtual user and counts as a failed session
+        outcomes.append(False)
+    finally:
+        browser.connection.close()
+
+
+def run_users(options, schedule):
+    """Run ``[(user_number, start_at), ...]`` in threads, return (samples, outcomes)."""
+    samples = []
+    outcomes = []
+    with ThreadPoolExecutor(max_workers=max(len(schedule), 1)) as pool:
+        for user_number, start_at in schedule:
+            pool.submit(virtual_user, options, user_number, start_at, samples, outcomes)
+    return samples, outcomes
+
+
+def build_schedule(options, started):
+    """Start time of every virtual user, from the ramp-up and spike settings."""
+    spike_users = int(options.users * options.spike)
+    ramp_users = options.users - spike_users
+    schedule = []
+    for index in range(ramp_users):
+        offset = options.ramp_up * index / ramp_users if ramp_users else 0
+        schedule.append(offset)
+    schedule.extend([options.spike_at] * spike_users)
+    return [(number, started + offset) for number, offset in enumerate(sorted(schedule), 1)]
+
+
+def report(samples, outcomes, elapsed):
+    by_name = {}
+    for name, status, seconds in samples:
+        by_name.setdefault(name, []).append((status, seconds))
+
+    completed = sum(outcomes)
+    print(f'\nDuration {elapsed:.1f}s, {len(samples)} requests ({len(samples) / elapsed:.1f}/s), '
+          f'{completed} sessions completed ({completed / elapsed:.2f}/s), {len(outcomes) - completed} failed')
+    print(f"{'url name':<26} {'requests':>8} {'errors':>7} {'err %':>6} {'req/s':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name in sorted(by_name):
+        rows = by_name[name]
+        timings = sorted(seconds * 1000 for _, seconds in rows)
+        errors = sum(1 for status, _ in rows if status == 0 or status >= 400)
+        print(f'{name:<26} {len(rows):>8} {errors:>7} {errors / len(rows) * 100:>6.1f} {len(rows) / elapsed:>7.1f} '
+              f'{percentile(timings, 0.50):>8.1f} {percentile(timings, 0.95):>8.1f} {percentile(timings, 0.99):>8.1f}')
+    return 1 if len(outcomes) - completed else 0
+
+
+def think_time(value):
+    low, _, high = value.partition(':')
+    low = float(low)
+    return low, float(high) if high else low
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate concurrent test takers against a running server')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--quiz', type=int, action='append', required=True, help='Quiz to take (repeatable)')
+    parser.add_argument('--users', type=int, default=50, help='Virtual users (default: 50)')
+    parser.add_argument('--sessions', type=int, default=1, help='Quizzes each virtual user takes (default: 1)')
+    parser.add_argument('--ramp-up', type=float, default=10, help='Seconds over which users start (default: 10)')
+    parser.add_argument('--think-time', type=think_time, default=(1.0, 3.0),
+                        help='Seconds spent on each question, MIN:MAX (default: 1:3)')
+    parser.add_argument('--spike', type=float, default=0.0,
+                        help='Fraction of users that start together, like an exam start (default: 0)')
+    parser.add_argument('--spike-at', type=float, default=0.0, help='When the spike starts, in seconds (default: 0)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Split the users over this many processes, each running threads (default: 1)')
+    parser.add_argument('--login', metavar='PREFIX', help='Log in generate_load_data users instead of registering')
+    parser.add_argument('--password', default='loadtest123')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args()
+    if not 0 <= options.spike <= 1:
+        parser.error('--spike must be between 0 and 1')
+
+    started = time.time() + 1
+    schedule = build_schedule(options, started)
+    print(f'{options.users} virtual users against {options.base_url}, quizzes {options.quiz}')
+
+    if options.processes > 1:
+        shares = [schedule[index::options.processes] for index in range(options.processes)]
+        samples, outcomes = [], []
+        with ProcessPoolExecutor(max_workers=options.processes) as pool:
+            for share_samples, share_outcomes in pool.map(run_users, [options] * len(shares), shares):
+                samples.extend(share_samples)
+                outcomes.extend(share_outcomes)
+    else:
+        samples, outcomes = run_users(options, schedule)
+
+    return report(samples, outcomes, time.time() - started)
+
+
+if __name__ == '__main__':
+    sys.exit(main())